@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -22,6 +23,8 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # PROFILING["ENABLED"] のときだけ動く（core/profiling.py）
+    "core.profiling.ProfilingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -46,11 +49,150 @@ TEMPLATES = [
 
 WSGI_APPLICATION = "config.wsgi.application"
 
-DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
+# DB は環境変数で切り替える
+#   DB_ENGINE=sqlite（既定）: SQLITE_PATH（既定 db.sqlite3）
+#     SQLITE_READ_REPLICA=1 で同じファイルを読み取り専用で開く "replica" を足す（ルーターの確認用）
+#   DB_ENGINE=postgres: DB_NAME / DB_USER / DB_PASSWORD / DB_HOST / DB_PORT
+#     DB_CONN_MAX_AGE（秒、既定 60）で接続を使い回す。DB_POOL_MAX_SIZE を入れると
+#     psycopg のプールを使う（プールと CONN_MAX_AGE は併用できないので 0 になる）
+#     DB_REPLICA_HOSTS=host1,host2 で読み取りレプリカ（認証情報は primary と同じ）
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == "postgres":
+    _pg = {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.environ.get("DB_NAME", "okadainsta"),
+        "USER": os.environ.get("DB_USER", "postgres"),
+        "PASSWORD": os.environ.get("DB_PASSWORD", ""),
+        "HOST": os.environ.get("DB_HOST", "localhost"),
+        "PORT": os.environ.get("DB_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.environ.get("DB_CONN_MAX_AGE", "60")),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {},
+    }
+    if os.environ.get("DB_POOL_MAX_SIZE"):
+        _pg["CONN_MAX_AGE"] = 0
+        _pg["OPTIONS"]["pool"] = {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", "2")),
+            "max_size": int(os.environ["DB_POOL_MAX_SIZE"]),
+            "timeout": int(os.environ.get("DB_POOL_TIMEOUT", "10")),
+        }
+    DATABASES = {"default": _pg}
+    for _i, _host in enumerate(filter(None, os.environ.get("DB_REPLICA_HOSTS", "").split(","))):
+        DATABASES[f"replica{_i + 1}"] = {
+            **_pg,
+            "HOST": _host.strip(),
+            "OPTIONS": dict(_pg["OPTIONS"]),
+            "TEST": {"MIRROR": "default"},
+        }
+else:
+    _sqlite_path = os.environ.get("SQLITE_PATH", str(BASE_DIR / "db.sqlite3"))
+    DATABASES = {
+        "default": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": _sqlite_path,
+            "OPTIONS": {
+                # WAL: 書き込み中も読み取りが止まらない。NORMAL は WAL なら壊れず fsync が減る。
+                # busy_timeout で書き込みロック待ちを database is locked にせず待つ
+                "init_command": (
+                    "PRAGMA journal_mode=WAL;"
+                    "PRAGMA synchronous=NORMAL;"
+                    "PRAGMA busy_timeout=5000;"
+                    "PRAGMA mmap_size=134217728;"
+                    "PRAGMA temp_store=MEMORY;"
+                ),
+                # 読んでから書くトランザクションが途中でロック昇格に失敗しないよう最初から書き込みロック
+                "transaction_mode": "IMMEDIATE",
+                "timeout": 5,
+            },
+        }
+    }
+    if os.environ.get("SQLITE_READ_REPLICA") == "1":
+        DATABASES["replica"] = {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": f"file:{_sqlite_path}?mode=ro",
+            "OPTIONS": {"uri": True, "init_command": "PRAGMA busy_timeout=5000;"},
+            "TEST": {"MIRROR": "default"},
+        }
+
+# 読み取りレプリカ（core/db_router.py。use_replicas() の中の読み取りだけが行く）
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["core.db_router.ReplicaRouter"]
+
+# キャッシュ: REDIS_URL があれば Redis、CACHE_DIR があればファイル、無ければプロセス内
+if os.environ.get("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["REDIS_URL"],
+        }
+    }
+elif os.environ.get("CACHE_DIR"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": os.environ["CACHE_DIR"],
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# セッション: SESSION_PROFILE で切り替える
+#   cached_db: キャッシュから読み、無ければ DB（書き込みは両方）。キャッシュがプロセスをまたいで
+#     共有されていないと別プロセスのログアウトが見えないので、既定は Redis / ファイルキャッシュのときだけ
+#   db: DB のみ（ローカルの既定）
+#   signed_cookies: サーバー側に持たない（署名付き Cookie。中身は利用者から読める・4KB まで）
+# どれでも中身が変わったときしか保存しない（SESSION_SAVE_EVERY_REQUEST=False）。
+# 期限切れの行は prune_sessions で消す
+SESSION_PROFILE = os.environ.get(
+    "SESSION_PROFILE",
+    "cached_db" if os.environ.get("REDIS_URL") or os.environ.get("CACHE_DIR") else "db",
+)
+SESSION_ENGINE = {
+    "cached_db": "django.contrib.sessions.backends.cached_db",
+    "db": "django.contrib.sessions.backends.db",
+    "signed_cookies": "django.contrib.sessions.backends.signed_cookies",
+}[SESSION_PROFILE]
+SESSION_SAVE_EVERY_REQUEST = False
+
+# ホーム / 検索フィードのキャッシュ（core/feed_cache.py）
+FEED_CACHE = {
+    "TTL": 60,
+    "LOCK_TIMEOUT": 10,
+    "WAIT_MS": 500,
+}
+
+# 会話のリアルタイム配信（core/realtime.py）。複数プロセスなら RedisBroker に
+MESSAGE_BROKER = {
+    "BACKEND": "core.realtime.InProcessBroker",
+    "OPTIONS": {},
+}
+if os.environ.get("REDIS_URL"):
+    MESSAGE_BROKER = {
+        "BACKEND": "core.realtime.RedisBroker",
+        "OPTIONS": {"url": os.environ["REDIS_URL"]},
     }
+
+# 通知の fan-out（core/notify.py）。"sync" にするとリクエスト内で書く
+NOTIFICATIONS = {
+    "MODE": "thread",
+    "WORKERS": 1,
+}
+
+# prune_notifications: 既読は READ_DAYS 日で削除、1人あたり最大 MAX_PER_USER 件
+NOTIFICATION_RETENTION = {
+    "READ_DAYS": 30,
+    "MAX_PER_USER": 200,
+}
+
+# リクエストのプロファイル（Server-Timing と /profiling/）。PROFILING=1 で有効
+PROFILING = {
+    "ENABLED": os.environ.get("PROFILING") == "1",
+    "SAMPLE_RATE": float(os.environ.get("PROFILING_SAMPLE_RATE", "0.01")),
 }
 
 AUTH_PASSWORD_VALIDATORS = []  # 開発中は一旦OFFでOK
@@ -64,12 +206,37 @@ STATIC_URL = "static/"
 # いま警告出てる STATICFILES_DIRS は外してOK（無いフォルダを指定してるのが原因）
 # 必要なら「プロジェクト直下に static/ フォルダを作る」か、下みたいに条件付きで。
 # STATICFILES_DIRS = [BASE_DIR / "static"]
+STATIC_ROOT = BASE_DIR / "staticfiles"
+
+# 本番は collectstatic で app.abc123.js のようなハッシュ付きの名前を出す（無期限キャッシュ可）。
+# DEBUG 中は runserver がそのまま配るので普通のストレージ
+STORAGES = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {
+        "BACKEND": (
+            "django.contrib.staticfiles.storage.StaticFilesStorage"
+            if DEBUG
+            else "django.contrib.staticfiles.storage.ManifestStaticFilesStorage"
+        ),
+    },
+}
 
 MEDIA_URL = "media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# PostView の書き込みバッファ（core/view_buffer.py）
+# FLUSH_INTERVAL_MS=0 にするとバッファせず同期で書く
+POST_VIEW_BUFFER = {
+    "BATCH_SIZE": 100,
+    "FLUSH_INTERVAL_MS": 1000,
+    "MAX_PENDING": 10000,
+}
+
+# rollup_post_views --prune で消す raw PostView の保持日数
+POST_VIEW_RETENTION_DAYS = 30
+
 LOGIN_URL = "/login/"
 LOGIN_REDIRECT_URL = "/"
 LOGOUT_REDIRECT_URL = "/"
@@ -0,0 +1,19 @@
+"""大量の行を少しずつ消す。
+
+一度に大きく DELETE すると SQLite の書き込みロックが長くなり、その間のリクエストが
+待たされる。なので pk 順に batch_size 件ずつ取り出し、1トランザクションずつ消す。
+prune 系のコマンド（通知・セッション・raw PostView）で使う。
+"""
+from django.db import transaction
+
+
+def delete_in_batches(qs, batch_size):
+    """qs に当たる行を batch_size 件ずつ消し、消した件数を返す。"""
+    model = qs.model
+    deleted = 0
+    while True:
+        pks = list(qs.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        with transaction.atomic():
+            deleted += model._default_manager.filter(pk__in=pks).delete()[0]
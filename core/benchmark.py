@@ -0,0 +1,407 @@
+"""views のクエリ数・応答時間の計測（bench_views コマンドと core/tests.py から使う）。
+
+seed() でそれらしいデータ（ユーザー・投稿・お気に入り・閲覧・会話・通知）を
+bulk_create でまとめて作り、scenarios() で各エンドポイント × タブ × 並び順の
+リクエストを組み立てる。run() が1本ずつ叩いてクエリ数と時間を測る。
+
+QUERY_BUDGETS はシナリオごとのクエリ数の上限。N+1 が入るとデータ量に比例して
+増えるので、ここを超えたらテストが落ちる。
+"""
+import math
+import random
+import statistics
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from . import search, tags
+from .models import (
+    Circle,
+    Conversation,
+    Favorite,
+    Message,
+    MessageRead,
+    Notification,
+    Post,
+    PostView,
+    Profile,
+    Tag,
+)
+from .notify import recount_unread
+from .rollups import rollup_post_views, view_totals
+from .sweeper import close_expired_posts
+
+# 計測中は非同期の書き込みを止めて、リクエスト内のクエリとして数える
+BENCH_SETTINGS = {
+    "NOTIFICATIONS": {"MODE": "sync"},
+    "POST_VIEW_BUFFER": {"FLUSH_INTERVAL_MS": 0},
+}
+
+# データ量のプリセット
+SCALES = {
+    # core/tests.py 用（1ページに収まらない程度）
+    "test": {
+        "users": 40, "posts": 60, "tags": 10, "favorites": 300, "views": 600,
+        "conversations": 120, "messages": 8, "notifications": 80,
+    },
+    "small": {
+        "users": 300, "posts": 1000, "tags": 30, "favorites": 3000, "views": 20000,
+        "conversations": 200, "messages": 20, "notifications": 100,
+    },
+    "medium": {
+        "users": 3000, "posts": 10000, "tags": 60, "favorites": 40000, "views": 200000,
+        "conversations": 2000, "messages": 30, "notifications": 200,
+    },
+}
+
+# シナリオ名 → 1リクエストのクエリ数の上限（キャッシュが空の状態）
+QUERY_BUDGETS = {
+    "app:home:recent": 5,
+    "app:home:popular": 5,
+    "app:home:fav": 5,
+    "app:home:trending": 6,
+    # 検索タブは件数（core.facets）の集計 1 クエリを含む
+    "app:search": 7,
+    "app:search:q": 9,
+    "app:search:filtered": 7,
+    "app:messages": 4,
+    "app:profile": 7,
+    "feed:home:recent:page2": 2,
+    "feed:home:popular:page2": 2,
+    "feed:search:page2": 2,
+    # 初回閲覧は PostView の記録が入る（重複除けはキャッシュなのでセッションは書かない）
+    "post_detail_json": 10,
+    "conversation_json": 6,
+    "conversation_json:before": 5,
+    "notifications_json": 4,
+    "notifications_json:page2": 4,
+    # Favorite の作成・カウンタ更新・更新後の件数と、投稿者への通知の fan-out（on_commit）
+    "toggle_favorite": 14,
+    # 件数によらず一定（bulk_create / 一括 delete / 一括 update / 件数の読み直し /
+    # 投稿者への通知は notify_many の1ジョブ）
+    "favorites_batch": 16,
+}
+
+WORDS = [
+    "サッカー", "フットサル", "バンド", "軽音", "写真", "映画", "読書会", "ボランティア",
+    "プログラミング", "ハッカソン", "ゼミ", "勉強会", "ダンス", "料理", "旅行", "英会話",
+    "tennis", "python", "design", "music", "camp", "study", "night", "weekend",
+]
+PLACES = ["1号館", "体育館", "図書館", "学生会館", "オンライン", "駅前", "グラウンド"]
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: str
+    method: str = "get"
+    data: dict = field(default_factory=dict)
+    content_type: str = ""
+
+    @property
+    def budget(self):
+        return QUERY_BUDGETS.get(self.name)
+
+
+def seed(scale="small", seed=0, **overrides):
+    """ベンチ用のデータを作る。計測に使うユーザー（一番データの多い人）を返す。"""
+    sizes = {**SCALES[scale], **overrides}
+    rnd = random.Random(seed)
+    now = timezone.now()
+    User = get_user_model()
+
+    User.objects.bulk_create([
+        User(username=f"bench{i}", password="!", email=f"bench{i}@example.com")
+        for i in range(sizes["users"])
+    ])
+    users = list(User.objects.filter(username__startswith="bench").order_by("id").values_list("id", flat=True))
+    me = users[0]
+    Profile.objects.bulk_create(
+        [Profile(user_id=uid, display_name=f"ユーザー{n}") for n, uid in enumerate(users)],
+        ignore_conflicts=True,
+    )
+    Circle.objects.bulk_create(
+        [Circle(owner_id=uid, name=f"サークル{n}") for n, uid in enumerate(users)],
+        ignore_conflicts=True,
+    )
+
+    Tag.objects.bulk_create(
+        [Tag(name=f"{w}{i}" if i else w) for i in range(sizes["tags"] // len(WORDS) + 1) for w in WORDS][:sizes["tags"]],
+        ignore_conflicts=True,
+    )
+    tag_ids = list(Tag.objects.values_list("id", flat=True))
+
+    posts = []
+    for i in range(sizes["posts"]):
+        words = rnd.sample(WORDS, 3)
+        posts.append(Post(
+            # 計測ユーザーにも自分の投稿を持たせる
+            author_id=me if i % 20 == 0 else rnd.choice(users),
+            title=" ".join(words[:2]),
+            circle_name=f"{words[2]}サークル",
+            place=rnd.choice(PLACES),
+            detail=" ".join(rnd.choices(WORDS, k=12)),
+            event_at=now + timedelta(days=rnd.randint(-60, 60), hours=rnd.randint(0, 23)),
+            category=rnd.choice(Post.CATEGORY_CHOICES)[0],
+            status="closed" if rnd.random() < 0.1 else "open",
+            created_at=now - timedelta(days=rnd.randint(0, 90), minutes=rnd.randint(0, 1440)),
+        ))
+    Post.objects.bulk_create(posts, batch_size=500)
+    close_expired_posts()
+    post_ids = list(Post.objects.order_by("id").values_list("id", flat=True))
+
+    Post.tags.through.objects.bulk_create(
+        [
+            Post.tags.through(post_id=pid, tag_id=tid)
+            for pid in post_ids
+            for tid in rnd.sample(tag_ids, min(2, len(tag_ids)))
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    tags.recount()
+
+    # 計測ユーザーは半分だけ保存しておく（保存する側の経路も測れるように）
+    fav_pairs = {(me, pid) for pid in rnd.sample(post_ids, min(60, len(post_ids) // 2))}
+    while len(fav_pairs) < min(sizes["favorites"], len(users) * len(post_ids)):
+        fav_pairs.add((rnd.choice(users), rnd.choice(post_ids)))
+    Favorite.objects.bulk_create(
+        [Favorite(user_id=uid, post_id=pid) for uid, pid in fav_pairs],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    PostView.objects.bulk_create(
+        [
+            PostView(
+                post_id=rnd.choice(post_ids),
+                user_id=rnd.choice(users) if rnd.random() < 0.7 else None,
+                viewed_at=now - timedelta(minutes=rnd.randint(0, 14 * 24 * 60)),
+            )
+            for _ in range(sizes["views"])
+        ],
+        batch_size=1000,
+    )
+    rollup_post_views()
+
+    # 非正規化カウンタを実数に合わせる
+    favs = {}
+    for _, pid in fav_pairs:
+        favs[pid] = favs.get(pid, 0) + 1
+    views = view_totals()
+    Post.objects.bulk_update(
+        [Post(id=pid, favs_count=favs.get(pid, 0), views_count=views.get(pid, 0)) for pid in post_ids],
+        ["favs_count", "views_count"],
+        batch_size=500,
+    )
+
+    _seed_conversations(rnd, sizes, users, post_ids, now)
+
+    Notification.objects.bulk_create(
+        [
+            Notification(
+                user_id=uid,
+                notif_type=rnd.choice(Notification.TYPE)[0],
+                text=f"通知 {n}",
+                url="/",
+                is_read=rnd.random() < 0.5,
+                created_at=now - timedelta(minutes=rnd.randint(0, 30 * 24 * 60)),
+            )
+            for uid in [me] + rnd.sample(users[1:], min(len(users) - 1, 50))
+            for n in range(sizes["notifications"])
+        ],
+        batch_size=1000,
+    )
+    recount_unread(users)
+
+    search.rebuild(Post.objects.prefetch_related("tags").order_by("pk"))
+    return User.objects.get(pk=me)
+
+
+def _seed_conversations(rnd, sizes, users, post_ids, now):
+    me = users[0]
+    # 受信箱が1ページ（50件）を超えるように、半分は計測ユーザーの会話にする
+    pairs = [
+        (me if i % 2 == 0 else rnd.choice(users[1:]), rnd.choice(users[1:]))
+        for i in range(sizes["conversations"])
+    ]
+    Conversation.objects.bulk_create([
+        Conversation(
+            title=f"会話 {i}",
+            post_id=rnd.choice(post_ids),
+            updated_at=now - timedelta(minutes=i),
+        )
+        for i in range(len(pairs))
+    ])
+    convo_ids = list(Conversation.objects.order_by("-id").values_list("id", flat=True)[:len(pairs)])[::-1]
+
+    Through = Conversation.participants.through
+    Through.objects.bulk_create(
+        [Through(conversation_id=cid, user_id=uid) for cid, pair in zip(convo_ids, pairs) for uid in set(pair)],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    messages = []
+    reads = []
+    for cid, (a, b) in zip(convo_ids, pairs):
+        start = now - timedelta(days=rnd.randint(1, 30))
+        for n in range(sizes["messages"]):
+            messages.append(Message(
+                conversation_id=cid,
+                sender_id=a if n % 2 == 0 else b,
+                body=" ".join(rnd.choices(WORDS, k=5)),
+                created_at=start + timedelta(minutes=n * 7),
+            ))
+        # 半分は途中まで既読
+        if rnd.random() < 0.5:
+            reads.append(MessageRead(
+                conversation_id=cid,
+                user_id=a,
+                last_read_at=start + timedelta(minutes=sizes["messages"] * 7 // 2),
+            ))
+    Message.objects.bulk_create(messages, batch_size=1000)
+    MessageRead.objects.bulk_create(reads, batch_size=1000, ignore_conflicts=True)
+
+
+def scenarios(user):
+    """計測するリクエストの一覧。2ページ目のカーソルなどはここで実際に取ってくる。"""
+    client = Client()
+    client.force_login(user)
+
+    post = Post.objects.order_by("-views_count", "-id").first()
+    convo = (
+        Conversation.objects.filter(participants=user)
+        .order_by("-updated_at")
+        .first()
+    )
+    latest = convo.messages.order_by("-created_at", "-id").values_list("id", flat=True).first()
+    # 保存・解除の両方（と投稿者への通知）を通すため、他人の未保存の投稿を保存し、保存済みを外す
+    others = Post.objects.exclude(author=user).order_by("-id")
+    unsaved = list(others.exclude(favorite__user=user).values_list("id", flat=True)[:11])
+    saved = list(others.filter(favorite__user=user).values_list("id", flat=True)[:10])
+    fav_post = unsaved.pop(0)
+    batch_ops = (
+        [{"post_id": pk, "desired_state": True} for pk in unsaved]
+        + [{"post_id": pk, "desired_state": False} for pk in saved]
+    )
+
+    def next_cursor(path):
+        return client.get(path).json()["next_cursor"] or ""
+
+    word = WORDS[0]
+    items = [
+        Scenario("app:home:recent", "/?tab=home&sort=recent"),
+        Scenario("app:home:popular", "/?tab=home&sort=popular"),
+        Scenario("app:home:fav", "/?tab=home&sort=fav"),
+        Scenario("app:home:trending", "/?tab=home&sort=trending"),
+        Scenario("app:search", "/?tab=search"),
+        Scenario("app:search:q", f"/?tab=search&q={word}"),
+        Scenario("app:search:filtered", "/?tab=search&category=sports&open=1"),
+        Scenario("app:messages", "/?tab=messages"),
+        Scenario("app:profile", "/?tab=profile"),
+        Scenario(
+            "feed:home:recent:page2",
+            "/feed/home/json/?sort=recent&cursor=" + next_cursor("/feed/home/json/?sort=recent"),
+        ),
+        Scenario(
+            "feed:home:popular:page2",
+            "/feed/home/json/?sort=popular&cursor=" + next_cursor("/feed/home/json/?sort=popular"),
+        ),
+        Scenario("feed:search:page2", "/feed/search/json/?cursor=" + next_cursor("/feed/search/json/")),
+        Scenario("post_detail_json", f"/posts/{post.id}/json/"),
+        Scenario("conversation_json", f"/messages/{convo.id}/json/"),
+        Scenario("conversation_json:before", f"/messages/{convo.id}/json/?before={latest}"),
+        Scenario("notifications_json", "/notifications/json/"),
+        Scenario(
+            "notifications_json:page2",
+            "/notifications/json/?cursor=" + next_cursor("/notifications/json/"),
+        ),
+        Scenario("toggle_favorite", f"/posts/{fav_post}/favorite/", method="post"),
+        Scenario(
+            "favorites_batch", "/favorites/batch/", method="post",
+            data={"ops": batch_ops}, content_type="application/json",
+        ),
+    ]
+    cache.clear()
+    return items
+
+
+def count_queries(client, scenario):
+    """1リクエストのクエリ数とステータスコード。"""
+    extra = {"content_type": scenario.content_type} if scenario.content_type else {}
+    with CaptureQueriesContext(connection) as ctx:
+        # テスト（TestCase）の中では on_commit が走らないので、通知の fan-out などもここで実行して数える
+        with TestCase.captureOnCommitCallbacks(execute=True):
+            response = getattr(client, scenario.method)(scenario.path, scenario.data, **extra)
+    return len(ctx.captured_queries), response.status_code
+
+
+def percentile(values, p):
+    """最近傍順位法のパーセンタイル（p は 0〜100）。"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+def run(user, items, repeat=20, warm=False):
+    """各シナリオを repeat 回叩いて結果の dict を返す。
+
+    warm=False なら毎回キャッシュを空にしてから叩く（フィードキャッシュなどが
+    効かない一番重い経路を測る）。クエリ数は1回目のもの。
+    """
+    client = Client()
+    client.force_login(user)
+    results = {}
+
+    for sc in items:
+        times = []
+        queries = status = None
+        for i in range(repeat):
+            if not warm:
+                cache.clear()
+            start = time.perf_counter()
+            n, code = count_queries(client, sc)
+            times.append((time.perf_counter() - start) * 1000)
+            if i == 0:
+                queries, status = n, code
+
+        results[sc.name] = {
+            "path": sc.path,
+            "method": sc.method,
+            "status": status,
+            "queries": queries,
+            "budget": sc.budget,
+            "over_budget": sc.budget is not None and queries > sc.budget,
+            "p50_ms": round(percentile(times, 50), 2),
+            "p90_ms": round(percentile(times, 90), 2),
+            "p99_ms": round(percentile(times, 99), 2),
+            "mean_ms": round(statistics.fmean(times), 2),
+        }
+    return results
+
+
+def compare(old, new, threshold=0.2):
+    """2つのレポートの差分。(シナリオ名, 旧, 新, 悪化したか) の list。
+
+    クエリ数が増えたか、p50 が threshold（割合）以上遅くなったら悪化。
+    """
+    rows = []
+    for name, cur in new["results"].items():
+        prev = old.get("results", {}).get(name)
+        if prev is None:
+            rows.append((name, None, cur, False))
+            continue
+        slower = prev["p50_ms"] > 0 and cur["p50_ms"] > prev["p50_ms"] * (1 + threshold)
+        rows.append((name, prev, cur, cur["queries"] > prev["queries"] or slower))
+    return rows
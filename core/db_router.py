@@ -0,0 +1,48 @@
+"""読み取りレプリカへの振り分け。
+
+全部の読み取りをレプリカに回すと、書いた直後の読み直し（投稿直後のリダイレクト先など）で
+レプリカの遅れが見えてしまう。なので use_replicas() の中の読み取りだけをレプリカに送る。
+フィード（ホーム / 検索）はキャッシュもあり少し古くても困らないのでここで使う。
+
+レプリカは settings.DATABASE_REPLICAS に並べた DB エイリアス。空なら何もしない。
+"""
+import contextvars
+import random
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, router
+
+_use_replicas = contextvars.ContextVar("use_replicas", default=False)
+
+
+@contextmanager
+def use_replicas():
+    token = _use_replicas.set(True)
+    try:
+        yield
+    finally:
+        _use_replicas.reset(token)
+
+
+def read_alias(model):
+    """model を読むときの DB エイリアス（raw SQL 用）。"""
+    return router.db_for_read(model) or DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = getattr(settings, "DATABASE_REPLICAS", [])
+        if replicas and _use_replicas.get():
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # レプリカは primary の複製なので同じ DB 扱い
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, "DATABASE_REPLICAS", [])
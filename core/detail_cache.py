@@ -0,0 +1,27 @@
+"""投稿詳細 JSON（post_detail_json）の閲覧者に依存しない部分のキャッシュ。
+
+中身が変わるところ（Post の保存・削除、タグの付け外し・名前の変更・削除）は
+core/signals.py から invalidate() する。view からは消さないので、
+admin での編集やユーザー削除に伴う cascade でも古いものが残らない。
+"""
+from django.core.cache import cache
+
+TTL = 60 * 60
+
+
+def key(pk):
+    return f"post_detail:{pk}"
+
+
+def get(pk):
+    return cache.get(key(pk))
+
+
+def store(pk, payload):
+    cache.set(key(pk), payload, TTL)
+
+
+def invalidate(post_ids):
+    post_ids = list(post_ids)
+    if post_ids:
+        cache.delete_many([key(pk) for pk in post_ids])
@@ -0,0 +1,61 @@
+"""検索タブの件数（カテゴリ別・タグ別・募集中/終了）。
+
+検索語で絞った投稿について、カテゴリ・status・タグごとの件数を
+UNION ALL の1クエリでまとめて数える。結果は feed_cache に入るので、
+Post の保存・削除などでバージョンが上がるまでは数え直さない。
+
+検索語が無いときのタグは core.tags.top_tags()（Tag.posts_count を F() で
+増減しているもの）をそのまま使う。
+
+件数は検索語だけで絞った母集団に対するもの（カテゴリやタグを選んでも
+他の選択肢の件数は変わらない）。全文検索のときの母集団は結果と同じく
+関連度の上位 search.MAX_CANDIDATES 件まで（それを超える分は結果にも出ないので数えない）。
+
+「募集中」は検索の「募集中のみ」と同じく status="open" かつ event_at が今以降。
+close_expired_posts がまだ閉じていない期限切れは「終了」に数える。
+"""
+from django.db.models import Case, CharField, Count, F, Q, Value, When
+from django.utils import timezone
+
+from .models import Post
+
+TOP_TAGS = 20
+
+
+def _group(qs, facet, key):
+    return (
+        qs.order_by()
+        .annotate(facet=Value(facet, output_field=CharField()), key=F(key) if isinstance(key, str) else key)
+        .values("facet", "key")
+        .annotate(n=Count("pk"))
+    )
+
+
+def facet_counts(posts, with_tags=True, top_tags=TOP_TAGS, now=None):
+    """posts（Post の QuerySet）の件数を返す。
+
+    {"category": {値: 件数}, "status": {"open": 件数, "closed": 件数}, "tags": [(名前, 件数), ...]}
+    with_tags=False ならタグは数えない（全体の件数は Tag.posts_count にある）。
+    """
+    ids = posts.order_by().values("pk")
+    base = Post.objects.filter(pk__in=ids)
+    is_open = Case(
+        When(Q(status="open", event_at__gte=now or timezone.now()), then=Value("open")),
+        default=Value("closed"),
+        output_field=CharField(),
+    )
+    groups = [_group(base, "status", is_open)]
+    if with_tags:
+        groups.append(_group(Post.tags.through.objects.filter(post_id__in=ids), "tag", "tag__name"))
+
+    rows = _group(base, "category", "category").union(*groups, all=True)
+
+    result = {"category": {}, "status": {"open": 0, "closed": 0}, "tags": []}
+    for row in rows:
+        if row["facet"] == "tag":
+            result["tags"].append((row["key"], row["n"]))
+        else:
+            result[row["facet"]][row["key"]] = row["n"]
+    result["tags"].sort(key=lambda t: (-t[1], t[0]))
+    result["tags"] = result["tags"][:top_tags]
+    return result
@@ -0,0 +1,110 @@
+"""フィード（ホーム / 検索）の描画結果キャッシュ。
+
+キーは (feed, 絞り込み条件, カーソル) とバージョン番号。Post の保存・削除、
+閲覧 rollup の更新でバージョンを上げると古いキーは参照されなくなり、TTL で消える。
+お気に入りの増減は「保存数順」の並びだけに別のバージョンを持たせて上げる
+（他の並びのカードの保存数は閲覧数と同じく TTL の間は古くてよい）。カードにユーザーごとの情報は無いので
+ログインの有無にかかわらず同じキャッシュを共有する。
+"""
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = "feed:version"
+FAV_VERSION_KEY = "feed:version:fav"
+HITS_KEY = "feed:stats:hits"
+MISSES_KEY = "feed:stats:misses"
+
+DEFAULTS = {
+    "TTL": 60,
+    # 再計算中のロックの寿命（秒）
+    "LOCK_TIMEOUT": 10,
+    # 他のリクエストが再計算中のとき待つ上限（ミリ秒）
+    "WAIT_MS": 500,
+}
+
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "FEED_CACHE", {})}
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def version():
+    return cache.get_or_set(VERSION_KEY, 1, timeout=None)
+
+
+def fav_version():
+    return cache.get_or_set(FAV_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate():
+    """全フィードのキャッシュを無効にする（バージョンを上げるだけ）。"""
+    _incr(VERSION_KEY)
+
+
+def invalidate_fav():
+    """保存数順のフィードだけ無効にする。お気に入りの増減で呼ぶ。"""
+    _incr(FAV_VERSION_KEY)
+
+
+def stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        "version": version(),
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 3) if total else None,
+    }
+
+
+def _key(feed, params):
+    digest = hashlib.md5(json.dumps(params, sort_keys=True).encode()).hexdigest()
+    ver = version()
+    if params.get("sort") == "fav":
+        ver = f"{ver}.{fav_version()}"
+    return f"feed:{ver}:{feed}:{digest}"
+
+
+def get_or_build(feed, params, build):
+    """キャッシュがあれば返し、無ければ build() の結果を入れて返す。
+
+    同じキーの再計算は1リクエストだけが行い、他は少し待ってその結果を使う。
+    """
+    conf = _conf()
+    key = _key(feed, params)
+
+    payload = cache.get(key)
+    if payload is not None:
+        _incr(HITS_KEY)
+        return payload
+    _incr(MISSES_KEY)
+
+    lock = f"{key}:lock"
+    if cache.add(lock, 1, timeout=conf["LOCK_TIMEOUT"]):
+        try:
+            payload = build()
+            cache.set(key, payload, timeout=conf["TTL"])
+        finally:
+            cache.delete(lock)
+        return payload
+
+    deadline = time.monotonic() + conf["WAIT_MS"] / 1000
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        payload = cache.get(key)
+        if payload is not None:
+            return payload
+    # 待ちきれなければ自分で作る（キャッシュには入れない）
+    return build()
@@ -0,0 +1,200 @@
+"""アップロード画像の変換（サムネイル / WebP / AVIF）。
+
+元画像の横に `<元の名前>.<variant>-<幅>.<拡張子>` で保存する。
+例: posts/abc.jpg → posts/abc.card-480.webp, posts/abc.card-480.jpg ...
+EXIF（位置情報など）は保存前に同期で落とし（strip_upload）、縮小版の変換だけを
+コミット後にワーカースレッドで行う。できたらモデルの *_variants_ready を True にし、
+それまではテンプレート側で元画像を出す。
+"""
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+# variant → (幅の一覧, 正方形に切り抜くか)
+VARIANTS = {
+    "card": ([480, 960], False),
+    "modal": ([720, 1440], False),
+    "avatar": ([96, 192], True),
+}
+
+# モデルのフィールド → 作る variant
+FIELD_VARIANTS = {
+    ("core.post", "image"): ["card", "modal"],
+    ("core.profile", "avatar"): ["avatar"],
+}
+
+# モデルのフィールド → 縮小版ができたかのフラグ
+READY_FIELDS = {
+    ("core.post", "image"): "image_variants_ready",
+    ("core.profile", "avatar"): "avatar_variants_ready",
+}
+
+# 新しい形式から順に。jpeg は <img> のフォールバック
+FORMATS = [fmt for fmt in ("avif", "webp") if features.check(fmt)] + ["jpeg"]
+EXT = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+MIME = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+QUALITY = {"avif": 55, "webp": 78, "jpeg": 82}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(name, variant, width, fmt):
+    stem, _ = os.path.splitext(name)
+    return f"{stem}.{variant}-{width}.{EXT[fmt]}"
+
+
+def _ready_field(instance, field_name):
+    return READY_FIELDS[(instance._meta.label_lower, field_name)]
+
+
+def variant_urls(fieldfile, variant):
+    """{形式: [(url, 幅), ...]}。まだ変換されていなければ None。"""
+    # ストレージに問い合わせず（カードごとの stat / リモートならネットワーク）モデルのフラグを見る
+    if not getattr(fieldfile.instance, _ready_field(fieldfile.instance, fieldfile.field.name)):
+        return None
+    widths, _ = VARIANTS[variant]
+    storage = fieldfile.storage
+    return {
+        fmt: [(storage.url(variant_name(fieldfile.name, variant, w, fmt)), w) for w in widths]
+        for fmt in FORMATS
+    }
+
+
+def prepare_upload(instance, field_name):
+    """モデルの保存前に呼ぶ（core/signals.py の pre_save）。
+
+    新しくアップロードされた画像は EXIF（位置情報など）を落としてから保存させる。
+    公開される MEDIA_URL に位置情報つきの元画像が一瞬でも置かれないように、
+    ストレージへの書き込みより前にやる。画像が変わったら縮小版のフラグを戻す。
+    """
+    fieldfile = getattr(instance, field_name)
+    if fieldfile and fieldfile._committed:
+        return
+    setattr(instance, _ready_field(instance, field_name), False)
+    if fieldfile:
+        _strip_upload(fieldfile)
+
+
+def _strip_upload(fieldfile):
+    upload = fieldfile.file
+    upload.seek(0)
+    try:
+        img = Image.open(upload)
+        img.load()
+    except (OSError, ValueError):
+        # 画像として読めないものは ImageField の検証に任せる
+        return
+    finally:
+        upload.seek(0)
+    if not img.getexif():
+        return
+    fmt = img.format
+    # 回転情報を画素に反映してから EXIF を捨てる
+    data = _encode(ImageOps.exif_transpose(img), fmt)
+    if data is not None:
+        fieldfile.file = ContentFile(data, name=upload.name)
+
+
+def process(fieldfile, variants, force=False):
+    """variant を全形式で書き出す。
+
+    strip_upload より前にアップロードされた元画像に EXIF が残っていればここで落とす。
+    """
+    storage = fieldfile.storage
+    with storage.open(fieldfile.name, "rb") as f:
+        img = Image.open(f)
+        img.load()
+    fmt = img.format
+    has_exif = bool(img.getexif())
+    # 回転情報を画素に反映してから EXIF（位置情報など）を捨てる
+    img = ImageOps.exif_transpose(img)
+
+    if has_exif:
+        _strip_original(storage, fieldfile.name, img, fmt)
+
+    rgb = img.convert("RGB")
+    for variant in variants:
+        widths, square = VARIANTS[variant]
+        for fmt in FORMATS:
+            for w in widths:
+                name = variant_name(fieldfile.name, variant, w, fmt)
+                if not force and storage.exists(name):
+                    continue
+                if square:
+                    resized = ImageOps.fit(rgb, (w, w), Image.Resampling.LANCZOS)
+                else:
+                    resized = rgb.copy()
+                    resized.thumbnail((w, w * 4), Image.Resampling.LANCZOS)
+                buf = io.BytesIO()
+                resized.save(buf, format=fmt.upper(), quality=QUALITY[fmt])
+                if storage.exists(name):
+                    storage.delete(name)
+                storage.save(name, ContentFile(buf.getvalue()))
+
+
+def _strip_original(storage, name, img, fmt):
+    data = _encode(img, fmt)
+    if data is None:
+        return
+    storage.delete(name)
+    storage.save(name, ContentFile(data))
+
+
+def _encode(img, fmt):
+    """EXIF を付けずに元と同じ形式で書き出したバイト列。書けない形式なら None。"""
+    fmt = (fmt or "JPEG").upper()
+    buf = io.BytesIO()
+    out = img.convert("RGB") if fmt == "JPEG" else img
+    try:
+        out.save(buf, format=fmt, quality=95)
+    except (KeyError, OSError, ValueError):
+        return None
+    return buf.getvalue()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="images")
+    return _executor
+
+
+def mark_ready(instance, field_name, name):
+    """縮小版ができたことを記録する（その間に画像が差し替えられていたら何もしない）。"""
+    type(instance)._default_manager.filter(pk=instance.pk, **{field_name: name}).update(
+        **{_ready_field(instance, field_name): True}
+    )
+
+
+def _run(instance, field_name, variants):
+    fieldfile = getattr(instance, field_name)
+    close_old_connections()
+    try:
+        process(fieldfile, variants)
+        mark_ready(instance, field_name, fieldfile.name)
+    except Exception:
+        logger.exception("image processing failed: %s", fieldfile.name)
+    finally:
+        close_old_connections()
+
+
+def schedule(instance, field_name):
+    """instance の画像の変換をコミット後にワーカーへ回す。"""
+    fieldfile = getattr(instance, field_name)
+    if not fieldfile:
+        return
+    if getattr(instance, _ready_field(instance, field_name)):
+        return
+    variants = FIELD_VARIANTS[(instance._meta.label_lower, field_name)]
+    transaction.on_commit(lambda: _get_executor().submit(_run, instance, field_name, variants))
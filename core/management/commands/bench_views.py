@@ -0,0 +1,111 @@
+import json
+import platform
+import subprocess
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.utils import timezone
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = "使い捨てのテスト DB にデータを入れて views のクエリ数と応答時間を測り、JSON で出す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scale", choices=sorted(benchmark.SCALES), default="small")
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--warm", action="store_true", help="キャッシュを消さずに測る")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--only", default="", help="シナリオ名の前方一致で絞る（例: app:home）")
+        parser.add_argument("--report", default="", help="結果を書き出す JSON ファイル")
+        parser.add_argument("--compare", default="", help="比べる前回のレポート")
+        parser.add_argument("--threshold", type=float, default=0.2, help="p50 がこの割合以上遅くなったら悪化")
+        parser.add_argument("--fail-on-regression", action="store_true")
+
+    def handle(self, *args, **opts):
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False, keepdb=False)
+        try:
+            with override_settings(
+                **benchmark.BENCH_SETTINGS,
+                CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+            ):
+                report = self._bench(opts)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        self._print(report)
+
+        if opts["report"]:
+            with open(opts["report"], "w") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            self.stdout.write(f"wrote {opts['report']}")
+
+        failed = [name for name, r in report["results"].items() if r["over_budget"]]
+        if opts["compare"]:
+            with open(opts["compare"]) as f:
+                old = json.load(f)
+            rows = benchmark.compare(old, report, opts["threshold"])
+            self._print_compare(rows)
+            failed += [name for name, _, _, worse in rows if worse]
+
+        if failed and opts["fail_on_regression"]:
+            raise CommandError(f"regressed: {', '.join(sorted(set(failed)))}")
+
+    def _bench(self, opts):
+        self.stdout.write(f"seeding ({opts['scale']}) ...")
+        user = benchmark.seed(opts["scale"], seed=opts["seed"])
+        items = [sc for sc in benchmark.scenarios(user) if sc.name.startswith(opts["only"])]
+        results = benchmark.run(user, items, repeat=opts["repeat"], warm=opts["warm"])
+        return {
+            "meta": {
+                "commit": _git_commit(),
+                "created_at": timezone.now().isoformat(),
+                "scale": opts["scale"],
+                "sizes": benchmark.SCALES[opts["scale"]],
+                "repeat": opts["repeat"],
+                "warm": opts["warm"],
+                "db": connection.vendor,
+                "django": django.get_version(),
+                "python": platform.python_version(),
+            },
+            "results": results,
+        }
+
+    def _print(self, report):
+        self.stdout.write(f"{'scenario':<28} {'status':>6} {'queries':>9} {'p50':>8} {'p90':>8} {'p99':>8}")
+        for name, r in report["results"].items():
+            budget = f"{r['queries']}/{r['budget']}" if r["budget"] is not None else str(r["queries"])
+            line = f"{name:<28} {r['status']:>6} {budget:>9} {r['p50_ms']:>8} {r['p90_ms']:>8} {r['p99_ms']:>8}"
+            self.stdout.write(self.style.ERROR(line) if r["over_budget"] else line)
+
+    def _print_compare(self, rows):
+        self.stdout.write("")
+        self.stdout.write(f"{'scenario':<28} {'queries':>10} {'p50 (ms)':>20}")
+        for name, prev, cur, worse in rows:
+            if prev is None:
+                self.stdout.write(f"{name:<28} {'(new)':>10}")
+                continue
+            queries = f"{prev['queries']}→{cur['queries']}"
+            p50 = f"{prev['p50_ms']}→{cur['p50_ms']}"
+            line = f"{name:<28} {queries:>10} {p50:>20}"
+            self.stdout.write(self.style.ERROR(line) if worse else line)
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
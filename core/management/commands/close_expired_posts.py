@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.sweeper import close_expired_posts
+
+
+class Command(BaseCommand):
+    help = "開催日時を過ぎた募集中の投稿を終了（closed）にする。cron などで数分おきに実行する"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **opts):
+        n = close_expired_posts(batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"closed {n} post(s)"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from core import images
+from core.models import Post, Profile
+
+
+class Command(BaseCommand):
+    help = "既存の投稿画像 / アバターの EXIF 削除と縮小版（AVIF / WebP / JPEG）の作成"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--force", action="store_true", help="作成済みの縮小版も作り直す")
+
+    def handle(self, *args, **opts):
+        targets = [
+            (Post.objects.exclude(image="").exclude(image=None), "image"),
+            (Profile.objects.exclude(avatar="").exclude(avatar=None), "avatar"),
+        ]
+        done = failed = 0
+        for qs, field in targets:
+            variants = images.FIELD_VARIANTS[(qs.model._meta.label_lower, field)]
+            for obj in qs.only("pk", field).iterator():
+                try:
+                    fieldfile = getattr(obj, field)
+                    images.process(fieldfile, variants, force=opts["force"])
+                    images.mark_ready(obj, field, fieldfile.name)
+                    done += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"{qs.model.__name__} {obj.pk}: {e}")
+        self.stdout.write(self.style.SUCCESS(f"processed {done} image(s), {failed} failed"))
@@ -0,0 +1,57 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from core.batching import delete_in_batches
+from core.models import Notification
+from core.notify import recount_unread
+
+
+class Command(BaseCommand):
+    help = "古い既読通知と、1人あたりの上限を超えた古い通知を少しずつ削除する"
+
+    def add_arguments(self, parser):
+        conf = getattr(settings, "NOTIFICATION_RETENTION", {})
+        parser.add_argument("--read-days", type=int, default=conf.get("READ_DAYS", 30))
+        parser.add_argument("--max-per-user", type=int, default=conf.get("MAX_PER_USER", 200))
+        parser.add_argument("--batch-size", type=int, default=1000, help="1トランザクションで消す件数")
+
+    def handle(self, *args, **opts):
+        batch = opts["batch_size"]
+
+        cutoff = timezone.now() - timedelta(days=opts["read_days"])
+        old_read = Notification.objects.filter(is_read=True, created_at__lt=cutoff)
+        n = delete_in_batches(old_read, batch)
+        self.stdout.write(self.style.SUCCESS(f"deleted {n} read notification(s) older than {opts['read_days']} day(s)"))
+
+        limit = opts["max_per_user"]
+        heavy = (
+            Notification.objects.values("user_id")
+            .annotate(c=Count("id"))
+            .filter(c__gt=limit)
+            .values_list("user_id", flat=True)
+            .order_by()
+        )
+        total = 0
+        for user_id in heavy:
+            # 新しい順に limit 件目より古いもの
+            edge = (
+                Notification.objects.filter(user_id=user_id)
+                .order_by("-created_at", "-id")
+                .values("created_at", "id")[limit - 1:limit]
+                .first()
+            )
+            if edge is None:
+                continue
+            overflow = Notification.objects.filter(user_id=user_id, created_at__lte=edge["created_at"]).exclude(
+                created_at=edge["created_at"], id__gte=edge["id"]
+            )
+            deleted = delete_in_batches(overflow, batch)
+            if deleted:
+                # 未読を消した可能性があるので数え直す
+                recount_unread([user_id])
+            total += deleted
+        self.stdout.write(self.style.SUCCESS(f"deleted {total} notification(s) over {limit} per user"))
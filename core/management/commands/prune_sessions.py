@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.batching import delete_in_batches
+
+# 期限切れの行が django_session に残るエンジン
+DB_ENGINES = {
+    "django.contrib.sessions.backends.db",
+    "django.contrib.sessions.backends.cached_db",
+}
+
+
+class Command(BaseCommand):
+    help = "期限切れのセッションを少しずつ削除する（clearsessions の分割版）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="1トランザクションで消す件数")
+
+    def handle(self, *args, **opts):
+        if settings.SESSION_ENGINE not in DB_ENGINES:
+            # Cookie は持っていない、キャッシュは TTL で消える
+            self.stdout.write(self.style.WARNING(f"{settings.SESSION_ENGINE} は DB に行を残さない"))
+            return
+
+        expired = Session.objects.filter(expire_date__lt=timezone.now())
+        deleted = delete_in_batches(expired, opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"deleted {deleted} expired session(s)"))
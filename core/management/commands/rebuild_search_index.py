@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core import search
+from core.models import Post
+
+
+class Command(BaseCommand):
+    help = "投稿の全文検索索引を作り直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **opts):
+        if search.get_backend() is None:
+            self.stdout.write(self.style.WARNING("この DB では全文検索を使わない（icontains で検索）"))
+            return
+        n = search.rebuild(Post.objects.prefetch_related("tags").order_by("pk"), batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"indexed {n} post(s)"))
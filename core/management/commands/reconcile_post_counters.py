@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core import tags
+from core.models import Favorite, Post, Tag
+from core.rollups import view_totals
+
+
+class Command(BaseCommand):
+    help = "Post.favs_count / views_count と Tag.posts_count を実数に合わせ直す"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true", help="ズレの件数だけ表示して更新しない")
+
+    def handle(self, *args, **opts):
+        favs = Favorite.objects.filter(post=OuterRef("pk")).order_by().values("post").annotate(c=Count("*")).values("c")
+        # raw PostView は prune されるので閲覧数は rollup + 未集約分から出す
+        views = view_totals()
+
+        posts = (
+            Post.objects.annotate(real_favs=Coalesce(Subquery(favs), 0))
+            .only("id", "favs_count", "views_count")
+            .order_by("id")
+        )
+
+        fixed = 0
+        batch = []
+        for p in posts.iterator(chunk_size=opts["batch_size"]):
+            real_views = views.get(p.id, 0)
+            if p.favs_count == p.real_favs and p.views_count == real_views:
+                continue
+            p.favs_count = p.real_favs
+            p.views_count = real_views
+            batch.append(p)
+            if len(batch) >= opts["batch_size"]:
+                fixed += self._flush(batch, opts["dry_run"])
+                batch = []
+        fixed += self._flush(batch, opts["dry_run"])
+
+        if opts["dry_run"]:
+            tag_fixed = Tag.objects.exclude(posts_count=tags.real_posts_count()).count()
+        else:
+            tag_fixed = tags.recount()
+
+        verb = "would fix" if opts["dry_run"] else "fixed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {fixed} post(s), {tag_fixed} tag(s)"))
+
+    def _flush(self, batch, dry_run):
+        if batch and not dry_run:
+            Post.objects.bulk_update(batch, ["favs_count", "views_count"])
+        return len(batch)
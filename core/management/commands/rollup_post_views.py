@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.rollups import prune_post_views, rollup_post_views
+
+
+class Command(BaseCommand):
+    help = "新しい PostView を時間/日単位の PostViewRollup に集約する（--prune で古い raw 行も削除）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50000)
+        parser.add_argument("--prune", action="store_true", help="集約済みで保持期間を過ぎた PostView を削除する")
+        parser.add_argument("--retain-days", type=int, default=None, help="既定は settings.POST_VIEW_RETENTION_DAYS")
+
+    def handle(self, *args, **opts):
+        n = rollup_post_views(batch_size=opts["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"rolled up {n} view(s)"))
+
+        if opts["prune"]:
+            deleted = prune_post_views(days=opts["retain_days"])
+            self.stdout.write(self.style.SUCCESS(f"pruned {deleted} view(s)"))
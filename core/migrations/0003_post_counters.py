@@ -0,0 +1,49 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:25
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model("core", "Post")
+    Favorite = apps.get_model("core", "Favorite")
+    PostView = apps.get_model("core", "PostView")
+
+    favs = Favorite.objects.filter(post=OuterRef("pk")).order_by().values("post").annotate(c=Count("*")).values("c")
+    views = PostView.objects.filter(post=OuterRef("pk")).order_by().values("post").annotate(c=Count("*")).values("c")
+    Post.objects.update(
+        favs_count=Coalesce(Subquery(favs), 0),
+        views_count=Coalesce(Subquery(views), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_conversation_post_post_category_alter_circle_name'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='favs_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='views_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-views_count', '-created_at'], name='post_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-favs_count', '-created_at'], name='post_fav_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:50
+
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from core import search
+
+    backend = search.get_backend(schema_editor.connection)
+    if backend is None:
+        return
+    Post = apps.get_model("core", "Post")
+    search.rebuild(Post.objects.prefetch_related("tags").order_by("pk"), conn=schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    from core import search
+
+    backend = search.get_backend(schema_editor.connection)
+    if backend is None:
+        return
+    with schema_editor.connection.cursor() as cursor:
+        backend.drop(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_post_view_rollups'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_post_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_popular_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='post',
+            name='post_fav_idx',
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-event_at', '-created_at', '-id'], name='post_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-views_count', '-created_at', '-id'], name='post_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-favs_count', '-created_at', '-id'], name='post_fav_idx'),
+        ),
+    ]
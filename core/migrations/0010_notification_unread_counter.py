@@ -0,0 +1,42 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:35
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_unread(apps, schema_editor):
+    Profile = apps.get_model("core", "Profile")
+    Notification = apps.get_model("core", "Notification")
+
+    unread = (
+        Notification.objects.filter(user=OuterRef("user"), is_read=False)
+        .order_by().values("user").annotate(c=Count("*")).values("c")
+    )
+    Profile.objects.update(unread_notifs=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_notification_coalesce'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notifs',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='notif_user_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['user', 'is_read', 'created_at'], name='notif_user_unread_idx'),
+        ),
+        migrations.RunPython(backfill_unread, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:43
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_posts_count(apps, schema_editor):
+    Tag = apps.get_model("core", "Tag")
+    PostTag = apps.get_model("core", "Post").tags.through
+
+    counts = (
+        PostTag.objects.filter(tag=OuterRef("pk"))
+        .order_by().values("tag").annotate(c=Count("*")).values("c")
+    )
+    Tag.objects.update(posts_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_notification_unread_counter'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='tag',
+            index=models.Index(fields=['-posts_count', 'name'], name='tag_popular_idx'),
+        ),
+        migrations.RunPython(backfill_posts_count, migrations.RunPython.noop),
+    ]
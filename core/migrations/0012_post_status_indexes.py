@@ -0,0 +1,30 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:45
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def close_expired(apps, schema_editor):
+    Post = apps.get_model("core", "Post")
+    Post.objects.filter(status="open", event_at__lt=timezone.now()).update(status="closed")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_tag_posts_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['status', '-event_at', '-created_at', '-id'], name='post_status_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['category', 'status', '-event_at', '-created_at', '-id'], name='post_cat_status_recent_idx'),
+        ),
+        migrations.RunPython(close_expired, migrations.RunPython.noop),
+    ]
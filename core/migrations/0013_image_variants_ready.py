@@ -0,0 +1,48 @@
+# Generated by Django 6.0.1 on 2026-10-17 00:11
+
+import os
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def _has_variants(name, last):
+    # core.images が最後に書く「一番大きい jpeg」があれば揃っている
+    stem, _ = os.path.splitext(name)
+    return default_storage.exists(f"{stem}.{last}.jpg")
+
+
+def mark_existing(apps, schema_editor):
+    for model, field, flag, last in [
+        ("Post", "image", "image_variants_ready", "modal-1440"),
+        ("Profile", "avatar", "avatar_variants_ready", "avatar-192"),
+    ]:
+        Model = apps.get_model("core", model)
+        ready = [
+            pk for pk, name in Model.objects.exclude(**{field: ""}).exclude(**{field: None})
+            .values_list("pk", field).iterator()
+            if _has_variants(name, last)
+        ]
+        for i in range(0, len(ready), 500):
+            Model.objects.filter(pk__in=ready[i:i + 500]).update(**{flag: True})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_post_status_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='image_variants_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='avatar_variants_ready',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_existing, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-17 00:20
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def mark_auto_closed(apps, schema_editor):
+    # 日時が過ぎて閉じているものは 0012 / close_expired_posts が閉じたものとみなす
+    Post = apps.get_model("core", "Post")
+    Post.objects.filter(status="closed", event_at__lt=timezone.now()).update(auto_closed=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_image_variants_ready'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='auto_closed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_auto_closed, migrations.RunPython.noop),
+    ]
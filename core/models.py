@@ -12,11 +12,16 @@ class Profile(models.Model):
     role = models.CharField(max_length=100, blank=True)
     bio = models.TextField(blank=True)
     avatar = models.ImageField(upload_to="avatars/", blank=True, null=True)
+    # 縮小版（core.images）ができたら True。画像を差し替えると False に戻る
+    avatar_variants_ready = models.BooleanField(default=False)
 
     stats_posts = models.PositiveIntegerField(default=0)
     stats_favs = models.PositiveIntegerField(default=0)
     stats_msgs = models.PositiveIntegerField(default=0)
 
+    # 未読通知数（core.notify が通知の作成・既読化と同じトランザクションで更新する）
+    unread_notifs = models.PositiveIntegerField(default=0)
+
     def __str__(self):
         return self.display_name or f"profile:{self.user_id}"
 
@@ -36,6 +41,13 @@ class Circle(models.Model):
 class Tag(models.Model):
     name = models.CharField(max_length=30, unique=True)
 
+    # このタグが付いた投稿の数（core.tags が m2m の増減で F() 更新、ズレは reconcile_post_counters で直す）
+    posts_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # 検索タブの人気タグ一覧用
+        indexes = [models.Index(fields=["-posts_count", "name"], name="tag_popular_idx")]
+
     def __str__(self):
         return self.name
 
@@ -62,24 +74,57 @@ class Post(models.Model):
     detail = models.TextField(blank=True)
     event_at = models.DateTimeField()
     image = models.ImageField(upload_to="posts/", blank=True, null=True)
+    # 縮小版（core.images）ができたら True。画像を差し替えると False に戻る
+    image_variants_ready = models.BooleanField(default=False)
 
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="open")
+    # 日時が過ぎて自動で閉じたもの（日時を先に延ばせばまた募集中に戻す。手で閉じたものは戻さない）
+    auto_closed = models.BooleanField(default=False)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default="other")
     tags = models.ManyToManyField(Tag, blank=True, related_name="posts")
 
     created_at = models.DateTimeField(default=timezone.now)
+    # 詳細 JSON の ETag / Last-Modified に使う（カウンタの F() 更新では変わらない）
+    updated_at = models.DateTimeField(auto_now=True)
 
     favorites = models.ManyToManyField(User, blank=True, related_name="favorite_posts", through="Favorite")
 
+    # 非正規化カウンタ（Favorite / PostView の増減時に F() で更新、ズレは reconcile_post_counters で直す）
+    favs_count = models.PositiveIntegerField(default=0)
+    views_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # フィードの keyset ページング用（core.views.SORT_KEYS と揃える）
+        indexes = [
+            models.Index(fields=["-event_at", "-created_at", "-id"], name="post_recent_idx"),
+            models.Index(fields=["-views_count", "-created_at", "-id"], name="post_popular_idx"),
+            models.Index(fields=["-favs_count", "-created_at", "-id"], name="post_fav_idx"),
+            # 「募集中のみ」とカテゴリ絞り込み（status は close_expired_posts が更新する）
+            models.Index(fields=["status", "-event_at", "-created_at", "-id"], name="post_status_recent_idx"),
+            models.Index(
+                fields=["category", "status", "-event_at", "-created_at", "-id"], name="post_cat_status_recent_idx"
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if kwargs.get("update_fields") is None:
+            if self.status == "open" and self.is_ended:
+                # 過去の日時で保存されたら最初から終了にしておく（それ以外は close_expired_posts が閉じる）
+                self.status, self.auto_closed = "closed", True
+            elif self.status == "closed" and self.auto_closed and not self.is_ended:
+                # 自動で閉じた投稿の日時を先に延ばしたら募集中に戻す
+                self.status, self.auto_closed = "open", False
+            elif self.status == "open":
+                self.auto_closed = False
+        super().save(*args, **kwargs)
+
     @property
     def is_ended(self):
         return self.event_at < timezone.now()
 
     @property
     def effective_status(self):
-        # 自動終了：event_at 過ぎたら closed 扱い
-        if self.is_ended:
-            return "closed"
+        # 自動終了は close_expired_posts（定期実行）が status に書き込む
         return self.status
 
     def __str__(self):
@@ -132,6 +177,10 @@ class Message(models.Model):
     body = models.TextField()
     created_at = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        # conversation_json の since / before ページング用
+        indexes = [models.Index(fields=["conversation", "created_at", "id"], name="message_convo_time_idx")]
+
     def __str__(self):
         return f"msg:{self.id}"
 
@@ -158,6 +207,16 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(default=timezone.now)
 
+    # 同じ会話の未読「新しいメッセージ」は1件にまとめて count を増やす
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, null=True, blank=True, related_name="+")
+    count = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at", "-id"], name="notif_user_list_idx"),
+            models.Index(fields=["user", "is_read", "created_at"], name="notif_user_unread_idx"),
+        ]
+
 
 class PostView(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="views")
@@ -166,3 +225,27 @@ class PostView(models.Model):
 
     class Meta:
         indexes = [models.Index(fields=["post", "viewed_at"])]
+
+
+class PostViewRollup(models.Model):
+    # PostView を時間/日単位に集約したもの（rollup_post_views で更新）
+    PERIODS = [
+        ("hour", "時間"),
+        ("day", "日"),
+    ]
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="view_rollups")
+    period = models.CharField(max_length=4, choices=PERIODS)
+    bucket = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+    unique_users = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [("post", "period", "bucket")]
+        indexes = [models.Index(fields=["period", "bucket"])]
+
+
+class RollupWatermark(models.Model):
+    # 集約済みの最後の PostView.id
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
@@ -0,0 +1,163 @@
+"""通知の配信（fan-out）。
+
+view からは notify() で積むだけにして、Notification の INSERT は
+コミット後にバックグラウンドのスレッドで bulk_create する。
+会話の「新しいメッセージ」は未読のものがあればそれの count を増やすだけにする。
+
+settings.NOTIFICATIONS["MODE"] が "sync" ならその場で書く（テスト・管理コマンド用）。
+"""
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Notification, Profile
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "MODE": "thread",
+    # 1 本なら同じ会話の合算が競合しない（SQLite の書き込みも直列になる）
+    "WORKERS": 1,
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "NOTIFICATIONS", {})}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_conf()["WORKERS"], thread_name_prefix="notify")
+    return _executor
+
+
+def notify(user_ids, notif_type, text, url="", conversation_id=None):
+    """user_ids に通知を送る。conversation_id を付けると未読の同じ会話の通知にまとめる。"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    _submit(fan_out, user_ids, notif_type, text, url, conversation_id)
+
+
+def notify_many(notifications):
+    """(user_id, notif_type, text, url) のリストを1つのジョブでまとめて送る（会話の合算はしない）。"""
+    notifications = list(notifications)
+    if not notifications:
+        return
+    _submit(fan_out_many, notifications)
+
+
+def _submit(fn, *args):
+    if _conf()["MODE"] == "sync":
+        transaction.on_commit(lambda: fn(*args))
+    else:
+        transaction.on_commit(lambda: _get_executor().submit(_run, fn, args))
+
+
+def _run(fn, args):
+    close_old_connections()
+    try:
+        fn(*args)
+    except Exception:
+        logger.exception("notification fan-out failed")
+    finally:
+        close_old_connections()
+
+
+def fan_out(user_ids, notif_type, text, url, conversation_id=None):
+    now = timezone.now()
+    with transaction.atomic():
+        merged = set()
+        if conversation_id is not None:
+            pending = Notification.objects.filter(
+                user_id__in=user_ids,
+                notif_type=notif_type,
+                conversation_id=conversation_id,
+                is_read=False,
+            )
+            # 読んでから update するまでに mark_all_read で既読にされると、その人は合算済み扱いのまま
+            # 通知も未読数も増えなくなるので、合算する行をロックしておく（SQLite は DB ごと直列）
+            rows = dict(pending.select_for_update().values_list("pk", "user_id"))
+            if rows:
+                Notification.objects.filter(pk__in=rows).update(count=F("count") + 1, text=text, created_at=now)
+            merged = set(rows.values())
+
+        new_ids = [uid for uid in dict.fromkeys(user_ids) if uid not in merged]
+        Notification.objects.bulk_create([
+            Notification(
+                user_id=uid,
+                notif_type=notif_type,
+                text=text,
+                url=url,
+                conversation_id=conversation_id,
+                created_at=now,
+            )
+            for uid in new_ids
+        ])
+        # まとめた分は既に未読として数えてあるので、新しく作った分だけ足す
+        _add_unread(new_ids, 1)
+
+
+def fan_out_many(notifications):
+    now = timezone.now()
+    with transaction.atomic():
+        Notification.objects.bulk_create([
+            Notification(user_id=uid, notif_type=notif_type, text=text, url=url, created_at=now)
+            for uid, notif_type, text, url in notifications
+        ])
+        # 同じ人に何件も行くことがあるので、件数ごとに When を分けて1回の UPDATE で足す
+        by_count = {}
+        for uid, n in Counter(uid for uid, *_ in notifications).items():
+            by_count.setdefault(n, []).append(uid)
+        user_ids = [uid for uids in by_count.values() for uid in uids]
+        Profile.objects.bulk_create([Profile(user_id=uid) for uid in user_ids], ignore_conflicts=True)
+        Profile.objects.filter(user_id__in=user_ids).update(
+            unread_notifs=F("unread_notifs") + Case(
+                *[When(user_id__in=uids, then=Value(n)) for n, uids in by_count.items()],
+                default=Value(0),
+            )
+        )
+
+
+def _add_unread(user_ids, n):
+    if not user_ids:
+        return
+    # Profile がまだ無いユーザーもいるので先に作っておく
+    Profile.objects.bulk_create([Profile(user_id=uid) for uid in user_ids], ignore_conflicts=True)
+    Profile.objects.filter(user_id__in=user_ids).update(unread_notifs=F("unread_notifs") + n)
+
+
+def unread_count(user):
+    """ヘッダーのバッジ用。Profile のカラムを読むだけ。"""
+    return Profile.objects.filter(user=user).values_list("unread_notifs", flat=True).first() or 0
+
+
+def mark_all_read(user):
+    with transaction.atomic():
+        Notification.objects.filter(user=user, is_read=False).update(is_read=True)
+        Profile.objects.filter(user=user).update(unread_notifs=0)
+
+
+def recount_unread(user_ids):
+    """Notification を消した後などに、未読数を数え直す。"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    unread = (
+        Notification.objects.filter(user=OuterRef("user"), is_read=False)
+        .order_by().values("user").annotate(c=Count("*")).values("c")
+    )
+    Profile.objects.filter(user_id__in=user_ids).update(unread_notifs=Coalesce(Subquery(unread), 0))
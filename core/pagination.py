@@ -0,0 +1,85 @@
+"""フィード用のカーソル（keyset）ページング。
+
+カーソルは並び順のキー値を base64 にしただけの不透明な文字列。
+OFFSET を使わないので何ページ目でも index を1回なめるだけで済む。
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+    if not isinstance(data, dict):
+        raise InvalidCursor("bad cursor")
+    return data
+
+
+def keyset_page(qs, keys, cursor=None, limit=20, tag=""):
+    """keys（全部降順）で並べた qs の1ページ分と次のカーソルを返す。
+
+    keys の最後は一意なカラム（id）にすること。tag はソート名などで、
+    別の並び順のカーソルを渡されたら InvalidCursor にする。
+    """
+    qs = qs.order_by(*[f"-{k}" for k in keys])
+
+    if cursor:
+        data = decode_cursor(cursor)
+        values = data.get("k")
+        if data.get("s") != tag or not isinstance(values, list) or len(values) != len(keys):
+            raise InvalidCursor("cursor does not match this feed")
+        model = qs.model
+        try:
+            values = [model._meta.get_field(k).to_python(v) for k, v in zip(keys, values)]
+        except Exception as e:
+            raise InvalidCursor(str(e)) from e
+
+        # (a, b, c) < (va, vb, vc) を展開した条件
+        cond = Q()
+        for i, k in enumerate(keys):
+            step = Q(**{f"{k}__lt": values[i]})
+            for j in range(i):
+                step &= Q(**{keys[j]: values[j]})
+            cond |= step
+        qs = qs.filter(cond)
+
+    items = list(qs[:limit + 1])
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor({"s": tag, "k": [getattr(last, k) for k in keys]})
+    return items, next_cursor
+
+
+def ranked_page(qs, ranked_ids, cursor=None, limit=20, tag=""):
+    """検索の関連度順など、上限つきの id リストの順に並べるページング。"""
+    offset = 0
+    if cursor:
+        data = decode_cursor(cursor)
+        offset = data.get("o")
+        if data.get("s") != tag or not isinstance(offset, int) or offset < 0:
+            raise InvalidCursor("cursor does not match this feed")
+
+    page_ids = ranked_ids[offset:offset + limit]
+    by_id = qs.in_bulk(page_ids)
+    items = [by_id[pk] for pk in page_ids if pk in by_id]
+
+    next_cursor = None
+    if offset + limit < len(ranked_ids):
+        next_cursor = encode_cursor({"s": tag, "o": offset + limit})
+    return items, next_cursor
@@ -0,0 +1,212 @@
+"""リクエスト単位のプロファイル（SQL・テンプレート・合計時間）。
+
+settings.PROFILING["ENABLED"] が True のときだけ有効（それ以外は MiddlewareNotUsed）。
+SAMPLE_RATE の割合のリクエストだけ測り、結果は
+  - Server-Timing ヘッダー（ブラウザの開発者ツールで見られる）
+  - 直近 HISTORY 件をキャッシュに置き、/profiling/（staff のみ）で一覧
+に出す。staff は ?_profile=1 を付けると必ず測る。
+
+同じ形の SQL（値だけ違う）が DUPLICATE_THRESHOLD 回以上出たものは
+N+1 の疑いとして fingerprint ごとに数える。
+"""
+import contextvars
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+from django.utils import timezone
+
+HISTORY_KEY = "profiling:recent"
+
+DEFAULTS = {
+    "ENABLED": False,
+    "SAMPLE_RATE": 0.01,
+    # 1リクエストで残す遅いクエリの数
+    "SLOW_QUERIES": 5,
+    "DUPLICATE_THRESHOLD": 3,
+    "HISTORY": 200,
+    "HEADER": True,
+}
+
+_current = contextvars.ContextVar("profiling_current", default=None)
+
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "PROFILING", {})}
+
+
+def enabled():
+    return _conf()["ENABLED"]
+
+
+_IN_LIST = re.compile(r"IN \((?:%s, )*%s\)")
+_SPACES = re.compile(r"\s+")
+
+
+def fingerprint(sql):
+    """値を除いた SQL の形（IN (%s, %s, ...) は長さをそろえる）。"""
+    return _SPACES.sub(" ", _IN_LIST.sub("IN (...)", sql)).strip()
+
+
+class RequestProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = []
+        self.sql_ms = 0.0
+        self.template_ms = 0.0
+        self._template_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper 用
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            self.sql_ms += ms
+            self.queries.append((sql, ms))
+
+    def summary(self, request, response, conf):
+        total_ms = (time.perf_counter() - self.start) * 1000
+        counts = Counter(fingerprint(sql) for sql, _ in self.queries)
+        duplicates = [
+            {"sql": fp[:500], "count": n}
+            for fp, n in counts.most_common()
+            if n >= conf["DUPLICATE_THRESHOLD"]
+        ]
+        slowest = sorted(self.queries, key=lambda q: q[1], reverse=True)[:conf["SLOW_QUERIES"]]
+        match = request.resolver_match
+        return {
+            "at": timezone.now().isoformat(),
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else "",
+            "status": response.status_code,
+            "total_ms": round(total_ms, 2),
+            "sql_ms": round(self.sql_ms, 2),
+            "sql_count": len(self.queries),
+            "template_ms": round(self.template_ms, 2),
+            "slowest": [{"sql": sql[:500], "ms": round(ms, 2)} for sql, ms in slowest],
+            "duplicates": duplicates,
+        }
+
+
+def _patch_template_render():
+    """テンプレートの描画時間を測れるようにする（一番外側の render だけ数える）。"""
+    if getattr(DjangoTemplate.render, "_profiled", False):
+        return
+    original = DjangoTemplate.render
+
+    def render(self, context=None, request=None):
+        prof = _current.get()
+        if prof is None:
+            return original(self, context, request)
+        prof._template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original(self, context, request)
+        finally:
+            prof._template_depth -= 1
+            if prof._template_depth == 0:
+                prof.template_ms += (time.perf_counter() - start) * 1000
+
+    render._profiled = True
+    DjangoTemplate.render = render
+
+
+def server_timing(data):
+    return ", ".join([
+        f"total;dur={data['total_ms']}",
+        f'sql;dur={data["sql_ms"]};desc="{data["sql_count"]} queries"',
+        f"tpl;dur={data['template_ms']}",
+        f'dup;desc="{len(data["duplicates"])} duplicated"',
+    ])
+
+
+def record(data, history):
+    # 取りこぼしても困らないので read-modify-write で済ませる
+    recent = cache.get(HISTORY_KEY) or []
+    recent.append(data)
+    cache.set(HISTORY_KEY, recent[-history:], timeout=None)
+
+
+def recent():
+    return cache.get(HISTORY_KEY) or []
+
+
+def clear():
+    cache.delete(HISTORY_KEY)
+
+
+def summarize(entries):
+    """view ごとの件数・平均/最大時間・平均クエリ数。遅い順。"""
+    by_view = {}
+    for e in entries:
+        s = by_view.setdefault(e["view"] or e["path"], {
+            "requests": 0, "total_ms": 0.0, "max_ms": 0.0, "sql_count": 0, "sql_ms": 0.0, "with_duplicates": 0,
+        })
+        s["requests"] += 1
+        s["total_ms"] += e["total_ms"]
+        s["max_ms"] = max(s["max_ms"], e["total_ms"])
+        s["sql_count"] += e["sql_count"]
+        s["sql_ms"] += e["sql_ms"]
+        s["with_duplicates"] += bool(e["duplicates"])
+
+    rows = []
+    for view, s in by_view.items():
+        n = s["requests"]
+        rows.append({
+            "view": view,
+            "requests": n,
+            "avg_ms": round(s["total_ms"] / n, 2),
+            "max_ms": round(s["max_ms"], 2),
+            "avg_sql_count": round(s["sql_count"] / n, 1),
+            "avg_sql_ms": round(s["sql_ms"] / n, 2),
+            "with_duplicates": s["with_duplicates"],
+        })
+    rows.sort(key=lambda r: r["avg_ms"], reverse=True)
+    return rows
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        _patch_template_render()
+
+    def _sampled(self, request, conf):
+        if request.GET.get("_profile") == "1":
+            user = getattr(request, "user", None)
+            if user is not None and user.is_staff:
+                return True
+        return random.random() < conf["SAMPLE_RATE"]
+
+    def __call__(self, request):
+        conf = _conf()
+        if not self._sampled(request, conf):
+            return self.get_response(request)
+
+        prof = RequestProfile()
+        token = _current.set(prof)
+        try:
+            with ExitStack() as stack:
+                # 全 DB 接続のクエリを測る（このリクエストの間だけ）
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(prof))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        data = prof.summary(request, response, conf)
+        record(data, conf["HISTORY"])
+        if conf["HEADER"]:
+            response.headers["Server-Timing"] = server_timing(data)
+        return response
@@ -0,0 +1,68 @@
+"""Service worker に渡すプリキャッシュ一覧。
+
+本番の static は ManifestStaticFilesStorage がハッシュ付きの名前で配るので、
+ここでは staticfiles_storage.url() で今の名前を引くだけ。一覧か
+service-worker.js の中身が変わるとバージョンが変わり、ブラウザが SW を
+更新して古いキャッシュを捨てる。
+"""
+import hashlib
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+# アプリの殻として最初に入れておく static（core/static/ 以下の名前）
+PRECACHE_ASSETS = [
+    "core/app.js",
+    "manifest.json",
+    "icons/icon-192.png",
+    "icons/icon-512.png",
+]
+
+SW_SOURCE = "service-worker.js"
+
+
+def _path_prefix(url):
+    # "static/" → "/static/"（CDN などの絶対 URL はそのまま）
+    return url if "://" in url or url.startswith("/") else "/" + url
+
+
+def _build():
+    urls = [staticfiles_storage.url(name) for name in PRECACHE_ASSETS]
+    offline_url = reverse("core:offline")
+    urls.append(offline_url)
+
+    with open(finders.find(SW_SOURCE), "rb") as f:
+        source = f.read().decode()
+
+    digest = hashlib.sha256()
+    digest.update(source.encode())
+    digest.update(json.dumps(urls).encode())
+    # DEBUG 中は名前にハッシュが付かないので中身も見る
+    for name in PRECACHE_ASSETS:
+        with open(finders.find(name), "rb") as f:
+            digest.update(f.read())
+    # オフラインページは static ではないので中身ごとバージョンに含める
+    digest.update(render_to_string("core/offline.html").encode())
+
+    return {
+        "version": digest.hexdigest()[:12],
+        "precache": urls,
+        "offline": offline_url,
+        "static_prefix": _path_prefix(settings.STATIC_URL),
+        "media_prefix": _path_prefix(settings.MEDIA_URL),
+    }, source
+
+
+_build_cached = lru_cache(maxsize=1)(_build)
+
+
+def service_worker_script():
+    """/service-worker.js の本文。設定を先頭に埋め込んだ service-worker.js。"""
+    # DEBUG 中はファイルを編集したらすぐ反映されるよう毎回作る
+    config, source = _build() if settings.DEBUG else _build_cached()
+    return f"self.__SW_CONFIG = {json.dumps(config)};\n{source}"
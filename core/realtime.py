@@ -0,0 +1,116 @@
+"""会話ごとの pub/sub（メッセージのリアルタイム配信）。
+
+既定の InProcessBroker は1プロセス内だけで完結し外部サービスは要らない。
+複数プロセス / 複数台で動かすときは settings.MESSAGE_BROKER で
+RedisBroker（要 redis パッケージ）などに差し替える。
+
+publish() は同期コード（view やシグナル）からどのスレッドでも呼べる。
+subscribe() は ASGI 側のイベントループで使う async context manager。
+"""
+import asyncio
+import json
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+def conversation_channel(convo_id):
+    return f"convo:{convo_id}"
+
+
+class InProcessBroker:
+    def __init__(self, **options):
+        self._lock = threading.Lock()
+        self._subs = defaultdict(set)
+
+    def publish(self, channel, event):
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+        for loop, queue in subs:
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, event)
+            except RuntimeError:
+                # ループが閉じた購読者（切断直後）
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        queue = asyncio.Queue()
+        sub = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subs[channel].add(sub)
+        try:
+            yield _QueueSubscription(queue)
+        finally:
+            with self._lock:
+                self._subs[channel].discard(sub)
+                if not self._subs[channel]:
+                    del self._subs[channel]
+
+
+class _QueueSubscription:
+    def __init__(self, queue):
+        self._queue = queue
+
+    async def get(self, timeout=None):
+        """次のイベント。timeout 秒来なければ None。"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RedisBroker:
+    def __init__(self, url="redis://localhost:6379/0", **options):
+        self.url = url
+        self._client = None
+
+    def publish(self, channel, event):
+        import redis
+
+        if self._client is None:
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel, json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, channel):
+        import redis.asyncio as aioredis
+
+        client = aioredis.from_url(self.url)
+        pubsub = client.pubsub()
+        await pubsub.subscribe(channel)
+        try:
+            yield _RedisSubscription(pubsub)
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+            await client.aclose()
+
+
+class _RedisSubscription:
+    def __init__(self, pubsub):
+        self._pubsub = pubsub
+
+    async def get(self, timeout=None):
+        msg = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        if msg is None:
+            return None
+        return json.loads(msg["data"])
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                conf = getattr(settings, "MESSAGE_BROKER", {})
+                cls = import_string(conf.get("BACKEND", "core.realtime.InProcessBroker"))
+                _broker = cls(**conf.get("OPTIONS", {}))
+    return _broker
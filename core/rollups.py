@@ -0,0 +1,147 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from . import feed_cache
+from .batching import delete_in_batches
+from .models import PostView, PostViewRollup, RollupWatermark
+
+WATERMARK = "post_views"
+
+TRUNCS = {
+    "hour": TruncHour,
+    "day": TruncDay,
+}
+SPANS = {
+    "hour": timedelta(hours=1),
+    "day": timedelta(days=1),
+}
+
+
+def _watermark():
+    wm, _ = RollupWatermark.objects.get_or_create(name=WATERMARK)
+    return wm
+
+
+def rollup_post_views(batch_size=50000):
+    """watermark より後の PostView だけを読んで rollup を更新する。
+
+    新しい行が触れた (post, bucket) は raw 行から数え直すので、
+    バケットが複数回に分かれて取り込まれても unique_users がずれない。
+    戻り値は取り込んだ PostView の件数。
+    """
+    total = 0
+    while True:
+        wm = _watermark()
+        pending = PostView.objects.filter(id__gt=wm.last_id)
+        # batch_size 件目の id を上限にする（足りなければ残り全部）
+        upper = list(pending.order_by("id").values_list("id", flat=True)[batch_size - 1:batch_size])
+        upper = upper[0] if upper else pending.aggregate(m=Max("id"))["m"]
+        if upper is None:
+            if total:
+                # 閲覧数の並び（trending）が変わるのでフィードのキャッシュを捨てる
+                feed_cache.invalidate()
+            return total
+
+        new = PostView.objects.filter(id__gt=wm.last_id, id__lte=upper)
+        with transaction.atomic():
+            for period in TRUNCS:
+                _refresh_buckets(period, new)
+            total += new.count()
+            wm.last_id = upper
+            wm.updated_at = timezone.now()
+            wm.save(update_fields=["last_id", "updated_at"])
+
+
+def _refresh_buckets(period, new):
+    trunc = TRUNCS[period]
+    touched = set(new.annotate(bucket=trunc("viewed_at")).values_list("post_id", "bucket").distinct())
+    if not touched:
+        return
+
+    posts = {p for p, _ in touched}
+    span = new.aggregate(lo=Min("viewed_at"), hi=Max("viewed_at"))
+    rows = (
+        PostView.objects.filter(
+            post_id__in=posts,
+            viewed_at__gte=_floor(period, span["lo"]),
+            viewed_at__lt=_floor(period, span["hi"]) + SPANS[period],
+        )
+        .annotate(bucket=trunc("viewed_at"))
+        .values("post_id", "bucket")
+        .annotate(views=Count("id"), unique_users=Count("user", distinct=True))
+        .order_by()
+    )
+
+    objs = [
+        PostViewRollup(
+            post_id=r["post_id"],
+            period=period,
+            bucket=r["bucket"],
+            views=r["views"],
+            unique_users=r["unique_users"],
+        )
+        for r in rows
+        if (r["post_id"], r["bucket"]) in touched
+    ]
+    PostViewRollup.objects.bulk_create(
+        objs,
+        update_conflicts=True,
+        unique_fields=["post", "period", "bucket"],
+        update_fields=["views", "unique_users"],
+    )
+
+
+def _floor(period, dt):
+    dt = timezone.localtime(dt).replace(minute=0, second=0, microsecond=0)
+    if period == "day":
+        dt = dt.replace(hour=0)
+    return dt
+
+
+def prune_post_views(days=None, batch_size=5000):
+    """集約済みかつ保持期間を過ぎた raw PostView を少しずつ消す。"""
+    if days is None:
+        days = getattr(settings, "POST_VIEW_RETENTION_DAYS", 30)
+    # 日の途中で切るとその日のバケットを数え直せなくなるので日単位で切る
+    cutoff = _floor("day", timezone.now() - timedelta(days=days))
+    last_id = _watermark().last_id
+
+    return delete_in_batches(PostView.objects.filter(viewed_at__lt=cutoff, id__lte=last_id), batch_size)
+
+
+def view_totals():
+    """post_id -> 累計閲覧数（day rollup + 未集約の raw 行）。"""
+    totals = dict(
+        PostViewRollup.objects.filter(period="day")
+        .values("post_id")
+        .annotate(v=Sum("views"))
+        .values_list("post_id", "v")
+        .order_by()
+    )
+    pending = (
+        PostView.objects.filter(id__gt=_watermark().last_id)
+        .values("post_id")
+        .annotate(v=Count("id"))
+        .values_list("post_id", "v")
+        .order_by()
+    )
+    for post_id, v in pending:
+        totals[post_id] = totals.get(post_id, 0) + v
+    return totals
+
+
+def trending_post_ids(days=7, limit=500):
+    """直近 days 日の閲覧数順の post id。rollup だけを読むのでコストは post × バケット数。"""
+    since = _floor("day", timezone.now() - timedelta(days=days - 1))
+    return list(
+        PostViewRollup.objects.filter(period="day", bucket__gte=since)
+        .values("post_id")
+        .annotate(v=Sum("views"))
+        .order_by("-v", "-post_id")
+        .values_list("post_id", flat=True)[:limit]
+    )
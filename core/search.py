@@ -0,0 +1,206 @@
+"""投稿の全文検索。
+
+SQLite では FTS5 仮想テーブル（core_post_fts）、PostgreSQL では tsvector +
+GIN（core_post_search）を使う。どちらも日本語が切れるように、かな・漢字の
+連続は uni-gram + bi-gram に、英数字は単語に分けた文字列を入れておく。
+全文検索が使えない DB では search_post_ids() が None を返すので、
+呼び出し側で icontains に落とす。
+"""
+import re
+import unicodedata
+
+from django.db import connection, connections
+
+from .db_router import read_alias
+from .models import Post
+
+# かな・カタカナ・CJK 統合漢字（拡張A / 互換漢字を含む）
+CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+TOKEN_RE = re.compile(rf"(?P<cjk>[{CJK}]+)|(?P<word>[^\W{CJK}]+)")
+
+FTS_TABLE = "core_post_fts"
+PG_TABLE = "core_post_search"
+
+# 検索語で拾う候補の上限（この中を絞り込み・並び替えする）
+MAX_CANDIDATES = 500
+
+
+def tokenize(text):
+    """NFKC 正規化してトークン列にする。かな漢字は 1文字 + 2文字の n-gram。"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    out = []
+    for m in TOKEN_RE.finditer(text):
+        if m.group("word"):
+            out.append(m.group("word"))
+            continue
+        run = m.group("cjk")
+        out.extend(run)
+        out.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return out
+
+
+def _query_terms(query):
+    """検索語 → (トークン, 前方一致するか) の列。
+
+    かな漢字は 2文字以上なら bi-gram だけ、1文字なら uni-gram で引く。
+    英数字は途中まで打った語でも当たるように前方一致にする。
+    """
+    text = unicodedata.normalize("NFKC", query or "").lower()
+    terms = []
+    for m in TOKEN_RE.finditer(text):
+        if m.group("word"):
+            terms.append((m.group("word"), True))
+            continue
+        run = m.group("cjk")
+        if len(run) == 1:
+            terms.append((run, False))
+        else:
+            terms.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+    # 重複除去（順序維持）
+    return list(dict.fromkeys(terms))
+
+
+def _document(post):
+    return {
+        "title": " ".join(tokenize(post.title)),
+        "circle_name": " ".join(tokenize(post.circle_name)),
+        "place": " ".join(tokenize(post.place)),
+        "detail": " ".join(tokenize(post.detail)),
+        "tags": " ".join(tokenize(" ".join(t.name for t in post.tags.all()))),
+    }
+
+
+class SqliteBackend:
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+            "USING fts5(title, circle_name, place, detail, tags, tokenize='unicode61')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+    def index(self, cursor, post):
+        doc = _document(post)
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, title, circle_name, place, detail, tags) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            [post.pk, doc["title"], doc["circle_name"], doc["place"], doc["detail"], doc["tags"]],
+        )
+
+    def remove(self, cursor, post_id):
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [post_id])
+
+    def clear(self, cursor):
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def search(self, cursor, terms, limit):
+        match = " ".join(
+            '"{}"{}'.format(tok.replace('"', '""'), "*" if prefix else "") for tok, prefix in terms
+        )
+        # bm25 の列の重み: title > tags/circle_name > place > detail
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, 10.0, 5.0, 3.0, 1.0, 5.0) LIMIT %s",
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+class PostgresBackend:
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+            "post_id bigint PRIMARY KEY REFERENCES core_post(id) ON DELETE CASCADE, "
+            "document tsvector NOT NULL)"
+        )
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {PG_TABLE}_document ON {PG_TABLE} USING GIN (document)")
+
+    def drop(self, cursor):
+        cursor.execute(f"DROP TABLE IF EXISTS {PG_TABLE}")
+
+    def index(self, cursor, post):
+        doc = _document(post)
+        cursor.execute(
+            f"INSERT INTO {PG_TABLE} (post_id, document) VALUES (%s, "
+            "setweight(to_tsvector('simple', %s), 'A') || "
+            "setweight(to_tsvector('simple', %s || ' ' || %s), 'B') || "
+            "setweight(to_tsvector('simple', %s), 'C') || "
+            "setweight(to_tsvector('simple', %s), 'D')) "
+            "ON CONFLICT (post_id) DO UPDATE SET document = EXCLUDED.document",
+            [post.pk, doc["title"], doc["circle_name"], doc["tags"], doc["place"], doc["detail"]],
+        )
+
+    def remove(self, cursor, post_id):
+        cursor.execute(f"DELETE FROM {PG_TABLE} WHERE post_id = %s", [post_id])
+
+    def clear(self, cursor):
+        cursor.execute(f"TRUNCATE {PG_TABLE}")
+
+    def search(self, cursor, terms, limit):
+        tsquery = " & ".join(
+            "'{}'{}".format(tok.replace("\\", "\\\\").replace("'", "''"), ":*" if prefix else "")
+            for tok, prefix in terms
+        )
+        cursor.execute(
+            f"SELECT post_id FROM {PG_TABLE}, to_tsquery('simple', %s) q "
+            "WHERE document @@ q ORDER BY ts_rank(document, q) DESC LIMIT %s",
+            [tsquery, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    "sqlite": SqliteBackend,
+    "postgresql": PostgresBackend,
+}
+
+
+def get_backend(conn=None):
+    cls = BACKENDS.get((conn or connection).vendor)
+    return cls() if cls else None
+
+
+def index_post(post):
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.index(cursor, post)
+
+
+def remove_post(post_id):
+    backend = get_backend()
+    if backend:
+        with connection.cursor() as cursor:
+            backend.remove(cursor, post_id)
+
+
+def rebuild(posts, conn=None, batch_size=500):
+    """posts（tags を prefetch 済みの QuerySet）で索引を作り直す。件数を返す。"""
+    conn = conn or connection
+    backend = get_backend(conn)
+    if backend is None:
+        return 0
+    n = 0
+    with conn.cursor() as cursor:
+        backend.create(cursor)
+        backend.clear(cursor)
+        for post in posts.iterator(chunk_size=batch_size):
+            backend.index(cursor, post)
+            n += 1
+    return n
+
+
+def search_post_ids(query, limit=MAX_CANDIDATES):
+    """関連度順の post id。全文検索が使えない DB では None。"""
+    # use_replicas() の中ならレプリカで引く
+    conn = connections[read_alias(Post)]
+    backend = get_backend(conn)
+    if backend is None:
+        return None
+    terms = _query_terms(query)
+    if not terms:
+        return []
+    with conn.cursor() as cursor:
+        return backend.search(cursor, terms, limit)
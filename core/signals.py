@@ -0,0 +1,127 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import detail_cache, feed_cache, images, search, tags
+from .models import Post, Profile, Tag
+
+# 検索索引に入っている Post のフィールド
+INDEXED_FIELDS = {"title", "circle_name", "place", "detail"}
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_feeds(sender, raw=False, **kwargs):
+    if raw or kwargs.get("action", "post_").startswith("pre_"):
+        return
+    feed_cache.invalidate()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_detail(sender, instance, raw=False, **kwargs):
+    # admin での編集や、ユーザー削除に伴う cascade でもここを通る
+    if not raw:
+        detail_cache.invalidate([instance.pk])
+
+
+@receiver(post_save, sender=Post)
+def index_post_on_save(sender, instance, update_fields=None, raw=False, **kwargs):
+    if raw or (update_fields and not INDEXED_FIELDS & set(update_fields)):
+        return
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_on_delete(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+def _refresh_tagged_posts(post_ids):
+    """タグが変わった投稿の検索索引と詳細キャッシュを直す。"""
+    post_ids = list(post_ids)
+    for p in Post.objects.filter(pk__in=post_ids).prefetch_related("tags"):
+        search.index_post(p)
+    detail_cache.invalidate(post_ids)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def index_post_on_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # tag.posts.clear() は pk_set が来ず、post_clear の時点では instance.posts も空なので控えておく
+        instance._cleared_post_ids = list(instance.posts.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+    if reverse:
+        # tag.posts.add(...) 側から変えられた場合
+        _refresh_tagged_posts(pk_set if action != "post_clear" else getattr(instance, "_cleared_post_ids", []))
+    else:
+        search.index_post(instance)
+        detail_cache.invalidate([instance.pk])
+
+
+@receiver(pre_delete, sender=Tag)
+def remember_posts_of_deleted_tag(sender, instance, **kwargs):
+    # Tag の削除では中間テーブルの行が m2m_changed なしで消える
+    instance._deleted_post_ids = list(instance.posts.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def index_posts_on_tag_delete(sender, instance, **kwargs):
+    _refresh_tagged_posts(getattr(instance, "_deleted_post_ids", []))
+
+
+@receiver(post_save, sender=Tag)
+def index_posts_on_tag_rename(sender, instance, created, raw=False, **kwargs):
+    if created or raw:
+        return
+    _refresh_tagged_posts(instance.posts.values_list("pk", flat=True))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def count_tag_posts(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and not reverse:
+        # clear は pk_set が来ないので消える前に控えておく
+        instance._cleared_tag_ids = list(instance.tags.values_list("pk", flat=True))
+    elif action == "post_clear":
+        if reverse:
+            tags.recount([instance.pk])
+        else:
+            tags.adjust(getattr(instance, "_cleared_tag_ids", []), -1)
+    elif action in ("post_add", "post_remove"):
+        delta = 1 if action == "post_add" else -1
+        if reverse:
+            tags.adjust([instance.pk], delta * len(pk_set))
+        else:
+            tags.adjust(pk_set, delta)
+
+
+@receiver(pre_delete, sender=Post)
+def uncount_tags_on_delete(sender, instance, **kwargs):
+    # 中間テーブルの行は m2m_changed なしで消えるのでここで引く
+    tags.adjust(list(instance.tags.values_list("pk", flat=True)), -1)
+
+
+@receiver(pre_save, sender=Post)
+def strip_post_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.prepare_upload(instance, "image")
+
+
+@receiver(pre_save, sender=Profile)
+def strip_avatar(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.prepare_upload(instance, "avatar")
+
+
+@receiver(post_save, sender=Post)
+def process_post_image(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.schedule(instance, "image")
+
+
+@receiver(post_save, sender=Profile)
+def process_avatar(sender, instance, raw=False, **kwargs):
+    if not raw:
+        images.schedule(instance, "avatar")
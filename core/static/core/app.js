@@ -0,0 +1,350 @@
+// templates/core/parts/scripts.html から読み込む。初期タブは <script data-initial-tab>、ユーザーは data-user
+const appScript = document.currentScript;
+
+// SW に今のユーザーを知らせる（前と違えば SW が JSON のキャッシュを捨てる）。JSON を取りに行く前に送る
+if ("serviceWorker" in navigator && navigator.serviceWorker.controller) {
+  navigator.serviceWorker.controller.postMessage({ type: "user", id: appScript.dataset.user || "" });
+}
+const navButtons = document.querySelectorAll(".nav-btn");
+
+// 遅延タブ: 初めて開いたときに /tabs/<tab>/ から中身を取ってくる
+const tabLoads = {};
+
+function loadTab(tab) {
+  const el = document.getElementById(`tab-${tab}`);
+  if (!el || !el.dataset.lazyTab || tabLoads[tab]) return;
+
+  const url = new URL(`/tabs/${tab}/`, window.location.origin);
+  new URL(window.location.href).searchParams.forEach((v, k) => {
+    if (k !== "tab") url.searchParams.set(k, v);
+  });
+
+  tabLoads[tab] = fetch(url, { credentials: "same-origin" })
+    .then(r => r.ok ? r.text() : Promise.reject(r.status))
+    .then(html => {
+      document.getElementById(`tab-${tab}`).outerHTML = html;
+      observeFeeds();
+      const current = new URL(window.location.href).searchParams.get("tab") || "home";
+      setTab(current, false);
+    })
+    .catch(() => { delete tabLoads[tab]; });
+}
+
+function setTab(tab, push=true) {
+  document.querySelectorAll(".tab-section").forEach(s => s.classList.add("hidden"));
+  const el = document.getElementById(`tab-${tab}`);
+  if (el) el.classList.remove("hidden");
+  loadTab(tab);
+
+  navButtons.forEach(b => {
+    const isActive = b.dataset.tab === tab;
+    b.classList.toggle("text-primary", isActive);
+    b.classList.toggle("text-slate-400", !isActive);
+  });
+
+  if (push) {
+    const url = new URL(window.location.href);
+    url.searchParams.set("tab", tab);
+    window.history.pushState({}, "", url.toString());
+  }
+}
+
+navButtons.forEach(btn => {
+  btn.addEventListener("click", () => setTab(btn.dataset.tab, true));
+});
+
+window.addEventListener("popstate", () => {
+  const url = new URL(window.location.href);
+  setTab(url.searchParams.get("tab") || "home", false);
+});
+
+// 無限スクロール: 一覧の下端が見えたら /feed/<feed>/json/?cursor=... で続きを足す
+const feedLoading = {};
+
+function loadMore(feed) {
+  const list = document.querySelector(`[data-feed="${feed}"]`);
+  const cursor = list && list.dataset.nextCursor;
+  if (!cursor || feedLoading[feed]) return;
+
+  const url = new URL(`/feed/${feed}/json/`, window.location.origin);
+  new URL(window.location.href).searchParams.forEach((v, k) => {
+    if (k !== "tab") url.searchParams.set(k, v);
+  });
+  url.searchParams.set("cursor", cursor);
+
+  feedLoading[feed] = true;
+  fetch(url, { credentials: "same-origin" })
+    .then(r => r.ok ? r.json() : Promise.reject(r.status))
+    .then(data => {
+      list.insertAdjacentHTML("beforeend", data.html);
+      list.dataset.nextCursor = data.next_cursor || "";
+    })
+    .catch(() => {})
+    .finally(() => { feedLoading[feed] = false; });
+}
+
+const feedObserver = new IntersectionObserver(entries => {
+  entries.forEach(e => { if (e.isIntersecting) loadMore(e.target.dataset.feedSentinel); });
+}, { rootMargin: "400px" });
+
+function observeFeeds() {
+  document.querySelectorAll("[data-feed-sentinel]").forEach(el => feedObserver.observe(el));
+}
+
+observeFeeds();
+setTab(appScript.dataset.initialTab || "home", false);
+
+// Modal
+const postModal = document.getElementById("postModal");
+const postModalBody = document.getElementById("postModalBody");
+
+function openPostModal(postId) {
+  postModalBody.textContent = "投稿ID: " + postId + "（ここは後で詳細表示を実装）";
+  postModal.classList.remove("hidden");
+}
+function closePostModal() {
+  postModal.classList.add("hidden");
+  postModalBody.textContent = "";
+}
+
+// 保存: 押すたびに送らず、「こうしたい」状態をためて少し待ってから /favorites/batch/ にまとめて送る。
+// 連打しても最後の状態だけが送られ、二重に届いても結果は同じ。
+const FAVORITE_FLUSH_MS = 800;
+const favState = new Map();    // postId -> 保存済みか（分かっている分だけ）
+const favPending = new Map();  // postId -> 送る予定の状態
+let favTimer = null;
+
+function csrfToken() {
+  const m = document.cookie.match(/(?:^|;\s*)csrftoken=([^;]+)/);
+  return m ? decodeURIComponent(m[1]) : "";
+}
+
+function renderFavorite(postId, isFav, favsCount) {
+  document.querySelectorAll(`[data-fav-button="${postId}"]`).forEach((b) => {
+    b.textContent = isFav ? "保存済み" : "保存";
+  });
+  if (favsCount !== undefined) {
+    document.querySelectorAll(`[data-fav-count="${postId}"]`).forEach((el) => {
+      el.textContent = favsCount;
+    });
+  }
+}
+
+const favToggling = new Set();  // 状態が分からないまま送った反転の返事待ち
+
+function toggleFavorite(postId) {
+  if (!favState.has(postId)) {
+    // カードは全員共通のキャッシュなので、最初の1回は今の状態が分からない。
+    // 「保存しない」と決めつけず、サーバーで反転してもらってから状態を覚える
+    if (favToggling.has(postId)) return;
+    favToggling.add(postId);
+    fetch(`/posts/${postId}/favorite/`, {
+      method: "POST",
+      headers: { "X-CSRFToken": csrfToken() },
+      credentials: "same-origin",
+    })
+      .then((r) => (r.ok ? r.json() : Promise.reject(r.status)))
+      .then((data) => {
+        favState.set(postId, data.is_fav);
+        renderFavorite(postId, data.is_fav, data.favs_count);
+      })
+      .catch(() => {})
+      .finally(() => favToggling.delete(postId));
+    return;
+  }
+  const isFav = !favState.get(postId);
+  favState.set(postId, isFav);
+  favPending.set(postId, isFav);
+  renderFavorite(postId, isFav);
+  clearTimeout(favTimer);
+  favTimer = setTimeout(flushFavorites, FAVORITE_FLUSH_MS);
+}
+
+function flushFavorites(keepalive = false) {
+  clearTimeout(favTimer);
+  favTimer = null;
+  if (!favPending.size) return;
+  const ops = [...favPending].map(([postId, desired]) => ({ post_id: postId, desired_state: desired }));
+  favPending.clear();
+  fetch("/favorites/batch/", {
+    method: "POST",
+    headers: { "Content-Type": "application/json", "X-CSRFToken": csrfToken() },
+    body: JSON.stringify({ ops }),
+    credentials: "same-origin",
+    keepalive,
+  })
+    .then((r) => (r.ok ? r.json() : Promise.reject(r.status)))
+    .then((data) => {
+      data.results.forEach((r) => {
+        // 返事を待つ間にまた押されていたら、そちらを優先する
+        if (favPending.has(r.post_id)) return;
+        favState.set(r.post_id, r.is_fav);
+        renderFavorite(r.post_id, r.is_fav, r.favs_count);
+      });
+    })
+    .catch(() => {
+      // 失敗したら次に押したときにまた送る（状態は画面のまま）
+      ops.forEach((op) => {
+        if (!favPending.has(op.post_id)) favPending.set(op.post_id, op.desired_state);
+      });
+    });
+}
+
+// タブを閉じる・移動するときに残りを送る
+window.addEventListener("pagehide", () => flushFavorites(true));
+
+// 会話: 開いたら履歴を取ってきて、あとは /messages/<id>/stream/ (SSE) の新着だけ足す
+const convoModal = document.getElementById("convoModal");
+const convoTitle = document.getElementById("convoTitle");
+const convoMessages = document.getElementById("convoMessages");
+const convoForm = document.getElementById("convoForm");
+let convoId = null;
+let convoLastId = 0;  // SSE の ?since= に使う（表示済みの最大 id）
+let convoSource = null;
+const convoSeen = new Set();
+
+let convoFirstId = 0;
+
+function messageRow(m) {
+  const row = document.createElement("div");
+  row.className = m.is_me ? "flex justify-end" : "flex justify-start";
+  row.dataset.msgId = m.id;
+  const bubble = document.createElement("div");
+  bubble.className = "max-w-[80%] rounded-2xl px-3 py-2 " + (m.is_me ? "bg-primary text-background-dark" : "bg-slate-100 dark:bg-input-dark");
+  bubble.textContent = m.body;
+  const meta = document.createElement("div");
+  meta.className = "mt-1 text-[10px] opacity-60";
+  meta.textContent = (m.is_me ? "" : m.sender + " ・ ") + m.created_at;
+  bubble.appendChild(meta);
+  row.appendChild(bubble);
+  return row;
+}
+
+function renderMessage(m) {
+  if (convoSeen.has(m.id)) return;
+  convoSeen.add(m.id);
+  convoLastId = Math.max(convoLastId, m.id);
+  if (!convoFirstId || m.id < convoFirstId) convoFirstId = m.id;
+  // SSE と送信の応答は順不同で届く（自分の送信より後のメッセージが先に来る）ので id 順の位置に入れる。
+  // ほとんどは末尾なので後ろから探す
+  let next = null;
+  for (let el = convoMessages.lastElementChild; el && Number(el.dataset.msgId) > m.id; el = el.previousElementSibling) {
+    next = el;
+  }
+  convoMessages.insertBefore(messageRow(m), next);
+  if (!next) convoMessages.scrollTop = convoMessages.scrollHeight;
+}
+
+// 遡り: ?before=<一番古い id> で前のページを上に足す
+function renderOlderButton(show) {
+  const old = document.getElementById("convoOlder");
+  if (old) old.remove();
+  if (!show) return;
+  const btn = document.createElement("button");
+  btn.id = "convoOlder";
+  btn.type = "button";
+  btn.className = "mx-auto text-xs text-slate-500 dark:text-slate-400 py-1";
+  btn.textContent = "過去のメッセージを読み込む";
+  btn.onclick = loadOlderMessages;
+  convoMessages.prepend(btn);
+}
+
+function loadOlderMessages() {
+  if (!convoId || !convoFirstId) return;
+  fetch(`/messages/${convoId}/json/?before=${convoFirstId}`, { credentials: "same-origin" })
+    .then(r => r.ok ? r.json() : Promise.reject(r.status))
+    .then(data => {
+      const anchor = document.getElementById("convoOlder");
+      const frag = document.createDocumentFragment();
+      data.messages.forEach(m => {
+        if (convoSeen.has(m.id)) return;
+        convoSeen.add(m.id);
+        frag.appendChild(messageRow(m));
+      });
+      if (anchor) anchor.after(frag); else convoMessages.prepend(frag);
+      if (data.messages.length) convoFirstId = data.messages[0].id;
+      renderOlderButton(data.has_more);
+    });
+}
+
+function openConversation(id) {
+  closeConversation();
+  convoId = id;
+  fetch(`/messages/${id}/json/`, { credentials: "same-origin" })
+    .then(r => r.ok ? r.json() : Promise.reject(r.status))
+    .then(data => {
+      convoTitle.textContent = data.title;
+      data.messages.forEach(renderMessage);
+      renderOlderButton(data.has_more);
+      convoModal.classList.remove("hidden");
+
+      convoSource = new EventSource(`/messages/${id}/stream/?since=${convoLastId}`);
+      convoSource.onmessage = e => {
+        const m = JSON.parse(e.data);
+        renderMessage(m);
+        if (!m.is_me) markConversationRead();
+      };
+    })
+    .catch(() => { convoId = null; });
+}
+
+// SSE で届いたものは conversation_json を通らないので、表示したら既読を送る（続けて来たらまとめて1回）
+const CONVO_READ_DEBOUNCE_MS = 1000;
+let convoReadTimer = null;
+
+function markConversationRead() {
+  clearTimeout(convoReadTimer);
+  convoReadTimer = setTimeout(sendConversationRead, CONVO_READ_DEBOUNCE_MS);
+}
+
+function sendConversationRead() {
+  convoReadTimer = null;
+  if (!convoId || !convoLastId) return;
+  const body = new FormData();
+  body.append("message_id", convoLastId);
+  fetch(`/messages/${convoId}/read/`, {
+    method: "POST",
+    body,
+    headers: { "X-CSRFToken": csrfToken() },
+    credentials: "same-origin",
+    keepalive: true,
+  }).catch(() => {});
+}
+
+function closeConversation() {
+  // 待っている既読は閉じる前に送る
+  if (convoReadTimer) {
+    clearTimeout(convoReadTimer);
+    sendConversationRead();
+  }
+  if (convoSource) convoSource.close();
+  convoSource = null;
+  convoId = null;
+  convoLastId = 0;
+  convoFirstId = 0;
+  convoSeen.clear();
+  convoMessages.textContent = "";
+  convoModal.classList.add("hidden");
+}
+
+convoForm.addEventListener("submit", e => {
+  e.preventDefault();
+  if (!convoId || !convoForm.body.value.trim()) return;
+  fetch(`/messages/${convoId}/send/json/`, { method: "POST", body: new FormData(convoForm), credentials: "same-origin" })
+    .then(r => r.json())
+    .then(data => {
+      if (!data.ok) return;
+      renderMessage(data.message);
+      convoForm.body.value = "";
+    });
+});
+
+const openConvo = new URL(window.location.href).searchParams.get("open_convo");
+if (openConvo) openConversation(openConvo);
+
+// オフライン用のキャッシュ（/service-worker.js）
+if ("serviceWorker" in navigator) {
+  window.addEventListener("load", () => {
+    navigator.serviceWorker.register("/service-worker.js").catch(() => {});
+  });
+}
@@ -1,2 +1,139 @@
-self.addEventListener("install", (e) => self.skipWaiting());
-self.addEventListener("activate", (e) => self.clients.claim());
+// /service-worker.js として配る（core/views.py service_worker）。
+// self.__SW_CONFIG（バージョン・プリキャッシュ一覧など）は Django が先頭に埋め込む。
+const CONFIG = self.__SW_CONFIG;
+const PRECACHE = `precache-${CONFIG.version}`;
+const RUNTIME_JSON = "json-v2";
+const RUNTIME_MEDIA = "media-v1";
+const RUNTIME_CDN = "cdn-v1";
+const META = "sw-meta-v1";
+const KEEP = [PRECACHE, RUNTIME_JSON, RUNTIME_MEDIA, RUNTIME_CDN, META];
+
+// 画像は数が増えるので古いものから捨てる
+const MAX_MEDIA_ENTRIES = 300;
+const MAX_JSON_ENTRIES = 100;
+
+// stale-while-revalidate にする JSON（フィードの続き）。
+// 通知や投稿詳細（is_owner / can_fav を含み no-cache）はユーザーごとに変わるのでネットワークのまま
+const SWR_JSON = [
+  /^\/feed\/[^/]+\/json\/$/,
+];
+
+// フォント・Tailwind の CDN（opaque でもそのまま返す）
+const CDN_HOSTS = ["fonts.googleapis.com", "fonts.gstatic.com", "cdn.tailwindcss.com"];
+
+self.addEventListener("install", (e) => {
+  e.waitUntil(
+    caches.open(PRECACHE)
+      .then((cache) => cache.addAll(CONFIG.precache))
+      .then(() => self.skipWaiting())
+  );
+});
+
+self.addEventListener("activate", (e) => {
+  e.waitUntil(
+    caches.keys()
+      .then((keys) => Promise.all(keys.filter((k) => !KEEP.includes(k)).map((k) => caches.delete(k))))
+      .then(() => self.clients.claim())
+  );
+});
+
+// JSON はログイン中のユーザーの分なので、ユーザーが変わったら（ログアウト・別アカウント）捨てる。
+// ページ（app.js）が読み込みのたびに {type: "user", id} を送ってくる。
+const USER_STAMP = "/__sw/user";
+
+self.addEventListener("message", (e) => {
+  if (e.data && e.data.type === "user") e.waitUntil(switchUser(String(e.data.id || "")));
+});
+
+async function switchUser(id) {
+  const meta = await caches.open(META);
+  const stamp = await meta.match(USER_STAMP);
+  if (stamp && (await stamp.text()) === id) return;
+  await caches.delete(RUNTIME_JSON);
+  await meta.put(USER_STAMP, new Response(id));
+}
+
+self.addEventListener("fetch", (e) => {
+  const req = e.request;
+  if (req.method !== "GET") return;
+  const url = new URL(req.url);
+
+  if (url.origin !== self.location.origin) {
+    if (CDN_HOSTS.includes(url.hostname)) e.respondWith(staleWhileRevalidate(e, RUNTIME_CDN));
+    return;
+  }
+
+  if (req.mode === "navigate") {
+    e.respondWith(networkFirstPage(req));
+    return;
+  }
+  // static はハッシュ付きの名前なので中身が変わらない
+  if (url.pathname.startsWith(CONFIG.static_prefix)) {
+    e.respondWith(cacheFirst(req, PRECACHE));
+    return;
+  }
+  // 画像の variant は元画像ごとに名前が決まっていて書き換えない
+  if (url.pathname.startsWith(CONFIG.media_prefix)) {
+    e.respondWith(cacheFirst(req, RUNTIME_MEDIA, MAX_MEDIA_ENTRIES));
+    return;
+  }
+  if (SWR_JSON.some((re) => re.test(url.pathname))) {
+    e.respondWith(staleWhileRevalidate(e, RUNTIME_JSON, MAX_JSON_ENTRIES));
+  }
+  // それ以外（/tabs/、SSE、会話の JSON など）はネットワークのまま
+});
+
+function cacheable(res) {
+  if (!res) return false;
+  if (res.type === "opaque") return true;
+  // no-cache は「毎回確かめてから使う」なので、確かめずに返す SWR では持たない
+  return res.ok && !/no-store|no-cache/.test(res.headers.get("Cache-Control") || "");
+}
+
+async function trim(cacheName, max) {
+  if (!max) return;
+  const cache = await caches.open(cacheName);
+  const keys = await cache.keys();
+  await Promise.all(keys.slice(0, Math.max(0, keys.length - max)).map((k) => cache.delete(k)));
+}
+
+async function cacheFirst(req, cacheName, max) {
+  const cached = await caches.match(req);
+  if (cached) return cached;
+  const res = await fetch(req);
+  if (cacheable(res)) {
+    const cache = await caches.open(cacheName);
+    await cache.put(req, res.clone());
+    trim(cacheName, max);
+  }
+  return res;
+}
+
+async function staleWhileRevalidate(e, cacheName, max) {
+  const req = e.request;
+  const cache = await caches.open(cacheName);
+  const cached = await cache.match(req);
+  const network = fetch(req)
+    .then(async (res) => {
+      if (cacheable(res)) {
+        await cache.put(req, res.clone());
+        trim(cacheName, max);
+      }
+      return res;
+    });
+
+  if (cached) {
+    // 更新はバックグラウンドで（SW が止められないよう waitUntil に渡す）
+    e.waitUntil(network.catch(() => {}));
+    return cached;
+  }
+  return network;
+}
+
+async function networkFirstPage(req) {
+  try {
+    return await fetch(req);
+  } catch (err) {
+    return (await caches.match(CONFIG.offline)) || Response.error();
+  }
+}
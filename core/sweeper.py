@@ -0,0 +1,31 @@
+"""開催日時を過ぎた投稿を status="closed" にする（close_expired_posts から定期実行）。
+
+Post.effective_status は status をそのまま返すだけなので、ここで閉じるまでは
+募集中に見える。検索の「募集中のみ」は event_at でも絞っているので取りこぼさない。
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import feed_cache
+from .models import Post
+
+
+def close_expired_posts(batch_size=1000, now=None):
+    """期限切れの募集中投稿を batch_size 件ずつ閉じる。閉じた件数を返す。"""
+    now = now or timezone.now()
+    closed = 0
+    while True:
+        with transaction.atomic():
+            ids = list(
+                Post.objects.filter(status="open", event_at__lt=now)
+                .order_by("event_at")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            # update() はシグナルを出さない（検索索引・updated_at には status が入っていない）
+            closed += Post.objects.filter(pk__in=ids, status="open").update(status="closed", auto_closed=True)
+
+    if closed:
+        feed_cache.invalidate()
+    return closed
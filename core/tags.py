@@ -0,0 +1,67 @@
+"""タグの解決と人気順の一覧。
+
+resolve() は名前のリストを Tag にまとめて引く（無いものは bulk_create）。
+Tag.posts_count は m2m の増減（core/signals.py）で F() で足し引きし、
+top_tags() はその上位をキャッシュから返す。
+"""
+from django.core.cache import cache
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Post, Tag
+
+TOP_TAGS_KEY = "tags:top"
+TOP_TAGS = 50
+TOP_TAGS_TTL = 60 * 10
+
+
+def resolve(names):
+    """names（重複なし・順序つき）の Tag を同じ順で返す。無い名前は作る。"""
+    if not names:
+        return []
+    by_name = {t.name: t for t in Tag.objects.filter(name__in=names)}
+    missing = [n for n in names if n not in by_name]
+    if missing:
+        # 同時に同じ名前が作られても落ちないように ignore_conflicts で入れて引き直す
+        Tag.objects.bulk_create([Tag(name=n) for n in missing], ignore_conflicts=True)
+        by_name.update((t.name, t) for t in Tag.objects.filter(name__in=missing))
+    return [by_name[n] for n in names if n in by_name]
+
+
+def top_tags(limit=TOP_TAGS):
+    """投稿数の多い順のタグ（[(name, posts_count), ...]）。"""
+    top = cache.get(TOP_TAGS_KEY)
+    if top is None:
+        top = list(
+            Tag.objects.filter(posts_count__gt=0)
+            .order_by("-posts_count", "name")
+            .values_list("name", "posts_count")[:TOP_TAGS]
+        )
+        cache.set(TOP_TAGS_KEY, top, TOP_TAGS_TTL)
+    return top[:limit]
+
+
+def adjust(tag_ids, delta):
+    """tag_ids の posts_count を delta だけ増減する。"""
+    if not tag_ids:
+        return
+    Tag.objects.filter(pk__in=tag_ids).update(posts_count=Greatest(F("posts_count") + delta, 0))
+    cache.delete(TOP_TAGS_KEY)
+
+
+def real_posts_count():
+    """Tag の行ごとの実際の投稿数（サブクエリ式）。"""
+    counts = (
+        Post.tags.through.objects.filter(tag=OuterRef("pk"))
+        .order_by().values("tag").annotate(c=Count("*")).values("c")
+    )
+    return Coalesce(Subquery(counts), 0)
+
+
+def recount(tag_ids=None):
+    """posts_count を中間テーブルの実数に合わせ直す（tag_ids で絞れる）。直した件数を返す。"""
+    real = real_posts_count()
+    qs = Tag.objects.all() if tag_ids is None else Tag.objects.filter(pk__in=tag_ids)
+    fixed = qs.exclude(posts_count=real).update(posts_count=real)
+    cache.delete(TOP_TAGS_KEY)
+    return fixed
@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from core.images import MIME, variant_urls
+
+register = template.Library()
+
+
+@register.simple_tag
+def picture(fieldfile, variant, sizes="100vw", css="", alt=""):
+    """変換済みなら AVIF / WebP の <source> と JPEG の <img> を srcset 付きで出す。
+
+    例: {% picture p.image "card" sizes="448px" css="w-full h-44 object-cover" alt="post image" %}
+    まだ変換されていなければ元画像の <img> だけ。
+    """
+    if not fieldfile:
+        return ""
+    urls = variant_urls(fieldfile, variant)
+    if urls is None:
+        return format_html('<img class="{}" src="{}" alt="{}" loading="lazy">', css, fieldfile.url, alt)
+
+    def srcset(fmt):
+        return ", ".join(f"{url} {w}w" for url, w in urls[fmt])
+
+    sources = format_html_join(
+        "",
+        '<source type="{}" srcset="{}" sizes="{}">',
+        ((MIME[fmt], srcset(fmt), sizes) for fmt in urls if fmt != "jpeg"),
+    )
+    fallback = urls["jpeg"][0][0]
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" alt="{}" loading="lazy" decoding="async"></picture>',
+        sources, css, fallback, srcset("jpeg"), sizes, alt,
+    )
@@ -1,3 +1,765 @@
-from django.test import TestCase
+import io
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image as PILImage
+
+from . import benchmark, facets, feed_cache, images, profiling, rollups, search, tags, views
+from .db_router import ReplicaRouter, use_replicas
+from .images import variant_urls
+from .models import (
+    Conversation,
+    Favorite,
+    Message,
+    MessageRead,
+    Notification,
+    Post,
+    PostView,
+    PostViewRollup,
+    Profile,
+    RollupWatermark,
+)
+from .notify import fan_out, mark_all_read, unread_count
+from .pagination import InvalidCursor, encode_cursor, keyset_page, ranked_page
+from .sweeper import close_expired_posts
+from .view_buffer import PostViewBuffer
+
+
+@override_settings(**benchmark.BENCH_SETTINGS)
+class QueryBudgetTests(TestCase):
+    """主要な views のクエリ数が benchmark.QUERY_BUDGETS を超えないこと。
+
+    seed のデータは1ページ（フィード 20 件・受信箱 50 件・通知 50 件）より多いので、
+    N+1 が入ると上限を超えて落ちる。速さは manage.py bench_views で測る。
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        with override_settings(**benchmark.BENCH_SETTINGS):
+            cls.user = benchmark.seed("test")
+            cls.scenarios = benchmark.scenarios(cls.user)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_every_scenario_has_a_budget(self):
+        names = {sc.name for sc in self.scenarios}
+        self.assertEqual(names, set(benchmark.QUERY_BUDGETS))
+
+    def test_query_budgets(self):
+        for sc in self.scenarios:
+            with self.subTest(sc.name):
+                cache.clear()
+                queries, status = benchmark.count_queries(self.client, sc)
+                self.assertEqual(status, 200)
+                self.assertLessEqual(queries, sc.budget, f"{sc.name}: {queries} queries (budget {sc.budget})")
+
+    def test_get_endpoints_do_not_write_the_session(self):
+        for sc in self.scenarios:
+            if sc.method != "get":
+                continue
+            with self.subTest(sc.name):
+                with CaptureQueriesContext(connection) as ctx:
+                    response = self.client.get(sc.path)
+                writes = [
+                    q["sql"] for q in ctx.captured_queries
+                    if "django_session" in q["sql"] and not q["sql"].lstrip().upper().startswith("SELECT")
+                ]
+                self.assertEqual(writes, [])
+                self.assertNotIn(settings.SESSION_COOKIE_NAME, response.cookies)
+
+
+class BenchmarkReportTests(TestCase):
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 99), 99)
+        self.assertIsNone(benchmark.percentile([], 50))
+
+    def test_compare_flags_query_and_latency_regressions(self):
+        old = {"results": {"a": {"queries": 3, "p50_ms": 10.0}, "b": {"queries": 3, "p50_ms": 10.0}}}
+        new = {"results": {
+            "a": {"queries": 4, "p50_ms": 10.0},
+            "b": {"queries": 3, "p50_ms": 13.0},
+            "c": {"queries": 1, "p50_ms": 1.0},
+        }}
+        worse = {name: flag for name, _, _, flag in benchmark.compare(old, new, threshold=0.2)}
+        self.assertEqual(worse, {"a": True, "b": True, "c": False})
+
+
+@override_settings(**benchmark.BENCH_SETTINGS)
+class ViewDedupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = benchmark.seed("test", posts=3, views=0)
+        cls.post = Post.objects.first()
+
+    def setUp(self):
+        cache.clear()
+
+    def views(self):
+        return PostView.objects.filter(post=self.post).count()
+
+    def test_logged_in_viewer_counted_once_per_day(self):
+        client = Client()
+        client.force_login(self.user)
+        session_key = client.session.session_key
+        client.get(f"/posts/{self.post.id}/json/")
+        client.get(f"/posts/{self.post.id}/json/")
+        self.assertEqual(self.views(), 1)
+        # セッションには何も書かない
+        self.assertNotIn("seen_posts", client.session.load())
+        self.assertEqual(client.session.session_key, session_key)
+
+    def test_anonymous_viewers_deduplicated_without_a_session(self):
+        a = Client(HTTP_USER_AGENT="phone")
+        a.get(f"/posts/{self.post.id}/json/")
+        a.get(f"/posts/{self.post.id}/json/")
+        self.assertNotIn("sessionid", a.cookies)
+        Client(HTTP_USER_AGENT="laptop").get(f"/posts/{self.post.id}/json/")
+        self.assertEqual(self.views(), 2)
+
+
+@override_settings(POST_VIEW_BUFFER={"BATCH_SIZE": 3, "FLUSH_INTERVAL_MS": 60000})
+class ViewBufferTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        benchmark.seed("test", posts=2, views=0)
+        cls.post = Post.objects.first()
+
+    def setUp(self):
+        self.buffer = PostViewBuffer()
+        self.addCleanup(self.buffer._stop.set)
+
+    def written(self):
+        self.post.refresh_from_db()
+        return PostView.objects.filter(post=self.post).count(), self.post.views_count
+
+    def test_flushes_at_batch_size(self):
+        before, count = self.written()
+        with mock.patch.object(self.buffer, "_ensure_thread"):
+            self.buffer.record(self.post.id)
+            self.buffer.record(self.post.id)
+            self.assertEqual(self.written(), (before, count))
+            self.buffer.record(self.post.id)
+        self.assertEqual(self.written(), (before + 3, count + 3))
+
+    @override_settings(POST_VIEW_BUFFER={"BATCH_SIZE": 100, "FLUSH_INTERVAL_MS": 10})
+    def test_flushes_on_interval_and_on_shutdown(self):
+        before, count = self.written()
+        flushed = threading.Event()
+        # タイマーのスレッドは別の DB 接続になるので、flush が呼ばれたことだけ見る
+        with mock.patch.object(self.buffer, "flush", side_effect=flushed.set):
+            self.buffer.record(self.post.id)
+            self.buffer.record(self.post.id)
+            self.assertTrue(flushed.wait(5))
+            self.buffer._stop.set()
+            self.buffer._thread.join(5)
+        self.assertEqual(self.written(), (before, count))
+        self.buffer.shutdown()
+        self.assertEqual(self.written(), (before + 2, count + 2))
+
+
+class SearchTokenizeTests(SimpleTestCase):
+    def test_kana_kanji_become_unigrams_and_bigrams(self):
+        self.assertEqual(search.tokenize("軽音部"), ["軽", "音", "部", "軽音", "音部"])
+
+    def test_words_are_normalized_and_kept_whole(self):
+        self.assertEqual(search.tokenize("ＰｙＴｈｏｎ入門 2024"), ["python", "入", "門", "入門", "2024"])
+
+    def test_query_uses_bigrams_and_prefix_words(self):
+        self.assertEqual(
+            search._query_terms("pyth 軽音部"),
+            [("pyth", True), ("軽音", False), ("音部", False)],
+        )
+
+    def test_single_kanji_query_uses_the_unigram(self):
+        self.assertEqual(search._query_terms("本"), [("本", False)])
+
+    def test_query_terms_are_deduplicated(self):
+        self.assertEqual(search._query_terms("ああああ"), [("ああ", False)])
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_user("u", password="x")
+        self.post = Post.objects.create(author=user, title="新歓", event_at=timezone.now() + timedelta(days=1))
+        self.rock, self.band = tags.resolve(["ロック", "バンド"])
+        self.post.tags.add(self.rock, self.band)
+
+    def found(self, query):
+        return self.post.pk in search.search_post_ids(query)
+
+    def test_reverse_clear_reindexes_the_posts(self):
+        self.assertTrue(self.found("ロック"))
+        self.rock.posts.clear()
+        self.assertFalse(self.found("ロック"))
+        self.assertTrue(self.found("バンド"))
+
+    def test_deleting_a_tag_reindexes_its_posts(self):
+        self.assertTrue(self.found("バンド"))
+        self.band.delete()
+        self.assertFalse(self.found("バンド"))
+        self.assertTrue(self.found("ロック"))
+
+
+class FacetCountsTests(TestCase):
+    def test_open_matches_the_open_only_filter(self):
+        user = get_user_model().objects.create_user("u", password="x")
+        soon = timezone.now() + timedelta(days=1)
+        posts = [Post.objects.create(author=user, title=str(i), event_at=soon) for i in range(3)]
+        # 期限切れだがまだ close_expired_posts が閉じていないもの
+        Post.objects.filter(pk=posts[1].pk).update(event_at=timezone.now() - timedelta(hours=1))
+        Post.objects.filter(pk=posts[2].pk).update(status="closed")
+
+        counts = facets.facet_counts(Post.objects.all(), with_tags=False)
+        self.assertEqual(counts["status"], {"open": 1, "closed": 2})
+        self.assertEqual(counts["category"], {"other": 3})
+
+
+class PaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        user = get_user_model().objects.create_user("u", password="x")
+        at = timezone.now() + timedelta(days=1)
+        # event_at / created_at は全部同じ、views_count は 3 通りだけ（id のタイブレークに頼る）
+        Post.objects.bulk_create([
+            Post(author=user, title=str(i), event_at=at, created_at=at, views_count=i % 3) for i in range(25)
+        ])
+        cls.user = user
+
+    def walk(self, keys, tag):
+        seen, cursor = [], None
+        while True:
+            items, cursor = keyset_page(Post.objects.all(), keys, cursor, limit=7, tag=tag)
+            seen += [p.pk for p in items]
+            if cursor is None:
+                return seen
+
+    def test_keyset_pages_have_no_duplicates_or_gaps_on_ties(self):
+        for sort in ("recent", "popular"):
+            with self.subTest(sort):
+                keys = views.SORT_KEYS[sort]
+                expected = list(Post.objects.order_by(*[f"-{k}" for k in keys]).values_list("pk", flat=True))
+                self.assertEqual(self.walk(keys, sort), expected)
+
+    def test_ranked_pages_follow_the_id_list(self):
+        ranked = list(Post.objects.order_by("?").values_list("pk", flat=True))
+        seen, cursor = [], None
+        while True:
+            items, cursor = ranked_page(Post.objects.all(), ranked, cursor, limit=7, tag="rank")
+            seen += [p.pk for p in items]
+            if cursor is None:
+                break
+        self.assertEqual(seen, ranked)
+
+    def test_mismatched_or_broken_cursors_are_rejected(self):
+        _, recent = keyset_page(Post.objects.all(), views.SORT_KEYS["recent"], limit=7, tag="recent")
+        _, ranked = ranked_page(Post.objects.all(), list(range(1, 30)), limit=7, tag="rank")
+        bad_value = encode_cursor({"s": "recent", "k": ["not a date", "x", 1]})
+        with self.assertRaises(InvalidCursor):
+            keyset_page(Post.objects.all(), views.SORT_KEYS["popular"], recent, tag="popular")
+        with self.assertRaises(InvalidCursor):
+            keyset_page(Post.objects.all(), views.SORT_KEYS["recent"], bad_value, tag="recent")
+        with self.assertRaises(InvalidCursor):
+            ranked_page(Post.objects.all(), [], recent, tag="rank")
+        with self.assertRaises(InvalidCursor):
+            keyset_page(Post.objects.all(), views.SORT_KEYS["recent"], ranked, tag="recent")
+
+        self.client.force_login(self.user)
+        for query in [f"?sort=popular&cursor={recent}", "?sort=recent&cursor=%%%", f"?sort=recent&cursor={bad_value}"]:
+            with self.subTest(query):
+                self.assertEqual(self.client.get(f"/feed/home/json/{query}").status_code, 400)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        User = get_user_model()
+        self.a, self.b, self.c = (User.objects.create_user(n, password="x") for n in "abc")
+        self.post = Post.objects.create(author=self.a, title="t", event_at=timezone.now() + timedelta(days=1))
+        self.hour = rollups._floor("hour", timezone.now() - timedelta(days=2))
+
+    def view(self, user, minute, day=None):
+        at = (day or self.hour) + timedelta(minutes=minute)
+        return PostView.objects.create(post=self.post, user=user, viewed_at=at)
+
+    def bucket(self, period="hour"):
+        r = PostViewRollup.objects.get(post=self.post, period=period, bucket=rollups._floor(period, self.hour))
+        return r.views, r.unique_users
+
+    def test_buckets_split_across_batches_are_recounted_exactly(self):
+        for user, minute in [(self.a, 1), (self.b, 2), (self.a, 3), (None, 4), (self.b, 5)]:
+            self.view(user, minute)
+        # 1つのバケットが 3 回に分かれて取り込まれる
+        self.assertEqual(rollups.rollup_post_views(batch_size=2), 5)
+        self.assertEqual(self.bucket(), (5, 2))
+        self.assertEqual(self.bucket("day"), (5, 2))
+        self.assertEqual(RollupWatermark.objects.get(name=rollups.WATERMARK).last_id, PostView.objects.latest("id").id)
+
+    def test_repeated_runs_only_read_new_rows(self):
+        self.view(self.a, 1)
+        self.view(self.b, 2)
+        rollups.rollup_post_views()
+        self.assertEqual(rollups.rollup_post_views(), 0)
+        self.assertEqual(self.bucket(), (2, 2))
+
+        self.view(self.a, 10)
+        self.assertEqual(rollups.rollup_post_views(), 1)
+        self.assertEqual(self.bucket(), (3, 2))
+        self.view(self.c, 20)
+        rollups.rollup_post_views()
+        self.assertEqual(self.bucket(), (4, 3))
+
+    def test_prune_keeps_unrolled_rows_and_the_boundary_day(self):
+        cutoff = rollups._floor("day", timezone.now() - timedelta(days=30))
+        old = self.view(self.a, -1, day=cutoff)
+        kept = self.view(self.a, 0, day=cutoff)
+        rollups.rollup_post_views()
+        # 集約前の古い行は消さない
+        pending = self.view(self.b, -2, day=cutoff)
+
+        self.assertEqual(rollups.prune_post_views(days=30), 1)
+        remaining = set(PostView.objects.values_list("id", flat=True))
+        self.assertNotIn(old.id, remaining)
+        self.assertEqual({kept.id, pending.id}, remaining)
+
+
+@override_settings(**benchmark.BENCH_SETTINGS)
+class PostDetailCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = get_user_model().objects.create_user("u", password="x")
+        self.post = Post.objects.create(author=self.user, title="before", event_at=timezone.now() + timedelta(days=1))
+        self.post.tags.add(*tags.resolve(["ロック"]))
+        self.url = f"/posts/{self.post.id}/json/"
+
+    def etag(self):
+        return self.client.get(self.url).headers["ETag"]
+
+    def test_unchanged_post_is_304(self):
+        etag = self.etag()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_edit_outside_the_view_is_200(self):
+        etag = self.etag()
+        # admin での編集と同じ（view を通らない save）
+        self.post.title = "after"
+        self.post.save()
+        r = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((r.status_code, r.json()["title"]), (200, "after"))
+
+    def test_tag_rename_and_delete_are_200(self):
+        etag = self.etag()
+        tag = self.post.tags.get()
+        tag.name = "ジャズ"
+        tag.save()
+        r = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((r.status_code, r.json()["tags"]), (200, ["ジャズ"]))
+
+        tag.delete()
+        r = self.client.get(self.url, HTTP_IF_NONE_MATCH=r.headers["ETag"])
+        self.assertEqual((r.status_code, r.json()["tags"]), (200, []))
+
+    def test_cascade_delete_clears_the_cache(self):
+        self.etag()
+        self.user.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_if_modified_since_alone_is_not_a_304(self):
+        r = self.client.get(self.url)
+        self.assertNotIn("Last-Modified", r.headers)
+        self.client.force_login(self.user)
+        r = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual((r.status_code, r.json()["is_owner"]), (200, True))
+
+
+class ConversationJsonTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.me = User.objects.create_user("me", password="x")
+        other = User.objects.create_user("other", password="x")
+        cls.convo = Conversation.objects.create(title="c")
+        cls.convo.participants.add(cls.me, other)
+        # 2件ずつ同じ時刻にして (created_at, id) のタイブレークも通す
+        start = timezone.now() - timedelta(hours=1)
+        Message.objects.bulk_create([
+            Message(conversation=cls.convo, sender=other, body=str(i), created_at=start + timedelta(seconds=i // 2))
+            for i in range(views.MESSAGE_PAGE_SIZE + 10)
+        ])
+        cls.ids = list(cls.convo.messages.order_by("created_at", "id").values_list("id", flat=True))
+
+    def setUp(self):
+        self.client.force_login(self.me)
+
+    def get(self, query=""):
+        return self.client.get(f"/messages/{self.convo.id}/json/{query}")
+
+    def ids_of(self, response):
+        return [m["id"] for m in response.json()["messages"]]
+
+    def test_default_is_the_newest_page(self):
+        r = self.get()
+        self.assertEqual(self.ids_of(r), self.ids[-views.MESSAGE_PAGE_SIZE:])
+        self.assertTrue(r.json()["has_more"])
+
+    def test_before_walks_back_without_gaps(self):
+        newest = self.ids_of(self.get())
+        older = self.get(f"?before={newest[0]}")
+        self.assertEqual(self.ids_of(older) + newest, self.ids)
+        self.assertFalse(older.json()["has_more"])
+
+    def test_since_returns_only_newer(self):
+        r = self.get(f"?since={self.ids[-4]}")
+        self.assertEqual(self.ids_of(r), self.ids[-3:])
+        self.assertEqual(self.ids_of(self.get(f"?since={self.ids[-1]}")), [])
+
+    def test_since_marks_read_only_what_it_returned(self):
+        self.get(f"?since={self.ids[0]}")
+        read = MessageRead.objects.get(conversation=self.convo, user=self.me)
+        returned = Message.objects.get(pk=self.ids[views.MESSAGE_PAGE_SIZE])
+        self.assertEqual(read.last_read_at, returned.created_at)
+        # まだ返していない新着は未読のまま
+        self.assertTrue(Message.objects.filter(conversation=self.convo, created_at__gt=read.last_read_at).exists())
+
+    def inbox_unread(self):
+        request = RequestFactory().get("/")
+        request.user = self.me
+        (convo,) = views._messages_context(request)["conversations"]
+        return convo["unread"]
+
+    def test_read_receipt_for_streamed_messages(self):
+        self.get()
+        self.assertEqual(self.inbox_unread(), 0)
+        # SSE で届いたメッセージ（conversation_json は通らない）
+        other = self.convo.participants.exclude(pk=self.me.pk).get()
+        streamed = [Message.objects.create(conversation=self.convo, sender=other, body=str(i)) for i in range(2)]
+        self.assertEqual(self.inbox_unread(), 2)
+
+        url = f"/messages/{self.convo.id}/read/"
+        self.assertEqual(self.client.post(url, {"message_id": streamed[-1].id}).status_code, 200)
+        self.assertEqual(self.inbox_unread(), 0)
+        for bad in ["0", "x", "999999"]:
+            with self.subTest(bad):
+                self.assertEqual(self.client.post(url, {"message_id": bad}).status_code, 400)
+
+    def test_bad_cursors_are_400(self):
+        for query in ["?since=0", "?before=0", "?since=-1", "?before=x", f"?since={2**70}", "?since=999999"]:
+            with self.subTest(query):
+                self.assertEqual(self.get(query).status_code, 400)
+
+
+class NotificationFanOutTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("u", password="x")
+        self.convo = Conversation.objects.create(title="c")
+
+    def message(self, text):
+        fan_out([self.user.id], "message", text, "/", conversation_id=self.convo.id)
+
+    def test_unread_message_alerts_are_coalesced(self):
+        self.message("1")
+        self.message("2")
+        n = Notification.objects.get(user=self.user)
+        self.assertEqual((n.count, n.text), (2, "2"))
+        self.assertEqual(unread_count(self.user), 1)
+
+    def test_read_alert_is_not_merged_into(self):
+        self.message("1")
+        mark_all_read(self.user)
+        self.message("2")
+        self.assertEqual(Notification.objects.filter(user=self.user, is_read=False).count(), 1)
+        self.assertEqual(unread_count(self.user), 1)
+
+
+class FavoritesBatchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = benchmark.seed("test", posts=3, favorites=0)
+        # seed は計測ユーザーの保存を必ず入れるので空にしておく
+        Favorite.objects.all().delete()
+        Post.objects.update(favs_count=0)
+        cls.posts = list(Post.objects.order_by("id"))
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def batch(self, ops):
+        return self.client.post("/favorites/batch/", {"ops": ops}, content_type="application/json")
+
+    def test_set_semantics_are_idempotent(self):
+        a, b, _ = self.posts
+        ops = [{"post_id": a.id, "desired_state": True}, {"post_id": b.id, "desired_state": True}]
+        self.batch(ops)
+        data = self.batch(ops).json()
+        self.assertEqual(
+            data["results"],
+            [{"post_id": a.id, "is_fav": True, "favs_count": 1}, {"post_id": b.id, "is_fav": True, "favs_count": 1}],
+        )
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 2)
+
+    def test_last_op_wins_and_missing_posts_are_reported(self):
+        a = self.posts[0]
+        data = self.batch([
+            {"post_id": a.id, "desired_state": True},
+            {"post_id": a.id, "desired_state": False},
+            {"post_id": 999999, "desired_state": True},
+        ]).json()
+        self.assertEqual(data["results"], [{"post_id": a.id, "is_fav": False, "favs_count": 0}])
+        self.assertEqual(data["missing"], [999999])
+
+    def test_toggle_flips_saved_state_and_404s_on_unknown_post(self):
+        # 画面が状態を知らないまま押しても、サーバー側の今の状態から反転する
+        a = self.posts[0]
+        self.batch([{"post_id": a.id, "desired_state": True}])
+        data = self.client.post(f"/posts/{a.id}/favorite/").json()
+        self.assertEqual((data["is_fav"], data["favs_count"]), (False, 0))
+        data = self.client.post(f"/posts/{a.id}/favorite/").json()
+        self.assertEqual((data["is_fav"], data["favs_count"]), (True, 1))
+        self.assertEqual(self.client.post("/posts/999999/favorite/").status_code, 404)
+
+    def test_rejects_malformed_ops(self):
+        pk = self.posts[0].id
+        for op in [
+            {"post_id": pk, "desired_state": "yes"},
+            {"post_id": 1e30, "desired_state": True},
+            {"post_id": 2**70, "desired_state": True},
+            {"post_id": True, "desired_state": True},
+            {"post_id": str(pk), "desired_state": True},
+            {"post_id": 0, "desired_state": True},
+        ]:
+            with self.subTest(op):
+                self.assertEqual(self.batch([op]).status_code, 400)
+        ops = [{"post_id": i, "desired_state": True} for i in range(1, 102)]
+        self.assertEqual(self.batch(ops).status_code, 400)
+
+    @override_settings(NOTIFICATIONS={"MODE": "sync"})
+    def test_owner_notifications_are_one_job(self):
+        a, b = Profile.objects.exclude(user=self.user).values_list("user_id", flat=True)[:2]
+        Post.objects.update(author_id=a)
+        Post.objects.filter(pk=self.posts[0].pk).update(author_id=b)
+
+        def state():
+            return [
+                (Notification.objects.filter(user_id=uid).count(), Profile.objects.get(user_id=uid).unread_notifs)
+                for uid in (a, b)
+            ]
+
+        before = state()
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.batch([{"post_id": p.id, "desired_state": True} for p in self.posts])
+        self.assertEqual(len(callbacks), 1)
+        (na, ua), (nb, ub) = before
+        self.assertEqual(state(), [(na + 2, ua + 2), (nb + 1, ub + 1)])
+
+    def test_toggle_still_flips(self):
+        a = self.posts[0]
+        self.assertTrue(self.client.post(f"/posts/{a.id}/favorite/").json()["is_fav"])
+        data = self.client.post(f"/posts/{a.id}/favorite/").json()
+        self.assertEqual((data["is_fav"], data["favs_count"]), (False, 0))
+
+    def test_only_fav_sorted_feeds_are_invalidated(self):
+        recent = feed_cache._key("home", {"sort": "recent", "cursor": None})
+        fav = feed_cache._key("home", {"sort": "fav", "cursor": None})
+        self.batch([{"post_id": self.posts[0].id, "desired_state": True}])
+        self.assertEqual(feed_cache._key("home", {"sort": "recent", "cursor": None}), recent)
+        self.assertNotEqual(feed_cache._key("home", {"sort": "fav", "cursor": None}), fav)
+
+
+class ImageUploadTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=tmp.name))
+        self.user = get_user_model().objects.create_user("u", password="x")
+
+    def jpeg_with_gps(self):
+        exif = PILImage.Exif()
+        exif[0x0112] = 6  # Orientation: 90° 回転
+        exif[0x8825] = {2: (35.0, 40.0, 0.0)}  # GPSInfo
+        buf = io.BytesIO()
+        PILImage.new("RGB", (40, 20), "red").save(buf, format="JPEG", exif=exif)
+        return SimpleUploadedFile("photo.jpg", buf.getvalue(), content_type="image/jpeg")
+
+    def test_exif_is_stripped_before_the_file_is_stored(self):
+        post = Post.objects.create(author=self.user, title="t", event_at=timezone.now(), image=self.jpeg_with_gps())
+        with post.image.storage.open(post.image.name, "rb") as f:
+            stored = PILImage.open(f)
+            self.assertFalse(stored.getexif())
+            # 回転は画素に反映されている
+            self.assertEqual(stored.size, (20, 40))
+        self.assertFalse(post.image_variants_ready)
+        self.assertIsNone(variant_urls(post.image, "card"))
+
+    def test_variants_ready_is_a_model_flag(self):
+        post = Post.objects.create(author=self.user, title="t", event_at=timezone.now(), image=self.jpeg_with_gps())
+        images.process(post.image, ["card", "modal"])
+        images.mark_ready(post, "image", post.image.name)
+        post.refresh_from_db()
+        with mock.patch.object(FileSystemStorage, "exists", side_effect=AssertionError("stat")):
+            self.assertIn("jpeg", variant_urls(post.image, "card"))
+
+        # 差し替えたら元画像に戻る
+        post.image = self.jpeg_with_gps()
+        post.save()
+        post.refresh_from_db()
+        self.assertFalse(post.image_variants_ready)
+
+
+class PostStatusTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("u", password="x")
+        self.post = Post.objects.create(author=self.user, title="t", event_at=timezone.now() + timedelta(hours=1))
+
+    def test_rescheduling_reopens_an_auto_closed_post(self):
+        close_expired_posts(now=timezone.now() + timedelta(hours=2))
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.status, self.post.auto_closed), ("closed", True))
+
+        # 編集フォームは status=closed のまま送ってくる
+        self.post.event_at = timezone.now() + timedelta(days=3)
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.status, self.post.auto_closed), ("open", False))
+
+    def test_manually_closed_post_stays_closed(self):
+        self.post.status = "closed"
+        self.post.save()
+        self.post.event_at = timezone.now() + timedelta(days=3)
+        self.post.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.status, "closed")
+
+    def test_saving_with_a_past_date_closes_automatically(self):
+        self.post.event_at = timezone.now() - timedelta(hours=1)
+        self.post.save()
+        self.assertEqual((self.post.status, self.post.auto_closed), ("closed", True))
+
+
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.db")
+class PruneNotificationsTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user("prune")
+        Profile.objects.create(user=self.user, unread_notifs=99)
+        self.now = timezone.now()
+
+    def notif(self, hours_ago, is_read=False, user=None):
+        return Notification.objects.create(
+            user=user or self.user, notif_type="favorite", text="t", is_read=is_read,
+            created_at=self.now - timedelta(hours=hours_ago),
+        )
+
+    def prune(self, **opts):
+        call_command("prune_notifications", batch_size=1, stdout=io.StringIO(), **opts)
+
+    def test_cap_keeps_newest_and_breaks_ties_by_id(self):
+        for hours_ago in (5, 4, 3):
+            self.notif(hours_ago)
+        tie_newer = self.notif(3, is_read=True)
+        newest, second = self.notif(1), self.notif(2)
+        self.prune(max_per_user=3)
+        # 3件目の (created_at, id) が境目。同時刻でも id が小さい方は消える
+        self.assertEqual(
+            set(Notification.objects.values_list("id", flat=True)), {newest.id, second.id, tie_newer.id}
+        )
+        # 消した中に未読があったので数え直す
+        self.assertEqual(Profile.objects.get(user=self.user).unread_notifs, 2)
+
+    def test_deletes_only_old_read_notifications(self):
+        old_read = self.notif(24 * 31, is_read=True)
+        old_unread = self.notif(24 * 31)
+        recent_read = self.notif(24 * 29, is_read=True)
+        self.prune(read_days=30, max_per_user=100)
+        self.assertEqual(
+            set(Notification.objects.values_list("id", flat=True)), {old_unread.id, recent_read.id}
+        )
+        self.assertFalse(Notification.objects.filter(pk=old_read.pk).exists())
+
+
+class PruneSessionsTests(TestCase):
+    def test_deletes_only_expired_sessions(self):
+        now = timezone.now()
+        Session.objects.create(session_key="old1", session_data="", expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key="old2", session_data="", expire_date=now - timedelta(days=2))
+        Session.objects.create(session_key="live", session_data="", expire_date=now + timedelta(days=1))
+        call_command("prune_sessions", batch_size=1, stdout=io.StringIO())
+        self.assertEqual(list(Session.objects.values_list("session_key", flat=True)), ["live"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica1", "replica2"])
+class ReplicaRouterTests(SimpleTestCase):
+    def test_reads_go_to_primary_by_default(self):
+        self.assertIsNone(ReplicaRouter().db_for_read(Post))
+
+    def test_reads_inside_use_replicas_go_to_a_replica(self):
+        with use_replicas():
+            self.assertIn(ReplicaRouter().db_for_read(Post), ["replica1", "replica2"])
+        self.assertIsNone(ReplicaRouter().db_for_read(Post))
+
+    def test_writes_and_migrations_stay_on_primary(self):
+        router = ReplicaRouter()
+        with use_replicas():
+            self.assertEqual(router.db_for_write(Post), "default")
+        self.assertTrue(router.allow_migrate("default", "core"))
+        self.assertFalse(router.allow_migrate("replica1", "core"))
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas_configured(self):
+        with use_replicas():
+            self.assertIsNone(ReplicaRouter().db_for_read(Post))
+
+
+@override_settings(PROFILING={"ENABLED": True, "SAMPLE_RATE": 1.0, "DUPLICATE_THRESHOLD": 2})
+class ProfilingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = benchmark.seed("test")
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.user)
+
+    def test_server_timing_and_history(self):
+        response = self.client.get("/?tab=home")
+        self.assertIn("sql;dur=", response.headers["Server-Timing"])
+
+        entry = profiling.recent()[-1]
+        self.assertEqual(entry["view"], "core:app")
+        self.assertGreater(entry["sql_count"], 0)
+        self.assertGreater(entry["template_ms"], 0)
+
+    @override_settings(PROFILING={"ENABLED": True, "SAMPLE_RATE": 0.0})
+    def test_unsampled_requests_are_untouched(self):
+        response = self.client.get("/?tab=home")
+        self.assertNotIn("Server-Timing", response.headers)
+        self.assertEqual(profiling.recent(), [])
+
+    def test_fingerprint_ignores_in_list_length(self):
+        self.assertEqual(
+            profiling.fingerprint('SELECT * FROM "t" WHERE "id" IN (%s, %s)'),
+            profiling.fingerprint('SELECT * FROM "t"  WHERE "id" IN (%s)'),
+        )
+
+    def test_report_is_staff_only(self):
+        self.assertEqual(self.client.get("/profiling/").status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get("/?tab=messages")
+        data = self.client.get("/profiling/").json()
+        self.assertIn("core:app", [row["view"] for row in data["summary"]])
@@ -6,6 +6,14 @@ app_name = "core"
 urlpatterns = [
     # ===== アプリ入口（単一画面）=====
     path("", views.app, name="app"),
+    path("tabs/<str:tab>/", views.tab_partial, name="tab_partial"),
+    path("feed/<str:feed>/json/", views.feed_json, name="feed_json"),
+    path("feed/cache-stats/", views.feed_cache_stats, name="feed_cache_stats"),
+    path("profiling/", views.profiling_report, name="profiling_report"),
+
+    # ===== PWA =====
+    path("service-worker.js", views.service_worker, name="service_worker"),
+    path("offline/", views.offline, name="offline"),
 
     # ===== Posts =====
     path("posts/create/", views.post_create, name="post_create"),
@@ -14,6 +22,7 @@ urlpatterns = [
 
     # Favorite（views.py は toggle_favorite / 引数は pk）
     path("posts/<int:pk>/favorite/", views.toggle_favorite, name="post_toggle_favorite"),
+    path("favorites/batch/", views.favorites_batch, name="favorites_batch"),
 
     # Post detail（JSON）
     path("posts/<int:pk>/json/", views.post_detail_json, name="post_detail_json"),
@@ -25,6 +34,9 @@ urlpatterns = [
     path("posts/<int:post_id>/dm/start/", views.start_conversation, name="start_conversation"),
     path("messages/<int:convo_id>/json/", views.conversation_json, name="conversation_json"),
     path("messages/<int:convo_id>/send/", views.send_message, name="send_message"),
+    path("messages/<int:convo_id>/send/json/", views.send_message_json, name="send_message_json"),
+    path("messages/<int:convo_id>/stream/", views.conversation_stream, name="conversation_stream"),
+    path("messages/<int:convo_id>/read/", views.conversation_read, name="conversation_read"),
 
     # ===== Notifications =====
     path("notifications/json/", views.notifications_json, name="notifications_json"),
@@ -0,0 +1,125 @@
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Post, PostView
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # この件数たまったら即 flush
+    "BATCH_SIZE": 100,
+    # これだけ経ったら件数に関係なく flush（0 ならバッファせず同期書き込み）
+    "FLUSH_INTERVAL_MS": 1000,
+    # flush 失敗が続いたときにメモリに残す上限（超えた分は古い順に捨てる＝最大損失件数）
+    "MAX_PENDING": 10000,
+}
+
+
+def _conf():
+    return {**DEFAULTS, **getattr(settings, "POST_VIEW_BUFFER", {})}
+
+
+class PostViewBuffer:
+    """PostView をメモリにためて bulk_create でまとめて書き込む。
+
+    views_count の加算も同じトランザクションで post ごとにまとめて行う。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = []
+        self._thread = None
+        self._stop = threading.Event()
+        self.dropped = 0
+
+    def record(self, post_id, user_id=None):
+        conf = _conf()
+        event = (post_id, user_id, timezone.now())
+
+        if conf["FLUSH_INTERVAL_MS"] <= 0:
+            self._write([event])
+            return
+
+        with self._lock:
+            self._pending.append(event)
+            overflow = len(self._pending) - conf["MAX_PENDING"]
+            if overflow > 0:
+                del self._pending[:overflow]
+                self.dropped += overflow
+                logger.warning("post view buffer full, dropped %d event(s)", overflow)
+            full = len(self._pending) >= conf["BATCH_SIZE"]
+
+        self._ensure_thread(conf)
+        if full:
+            self.flush()
+
+    def flush(self):
+        # flush は1本ずつ（timer と request が同時に走っても二重に書かない）
+        with self._flush_lock:
+            with self._lock:
+                events, self._pending = self._pending, []
+            if not events:
+                return 0
+            try:
+                self._write(events)
+            except Exception:
+                logger.exception("post view flush failed, re-queueing %d event(s)", len(events))
+                with self._lock:
+                    self._pending[:0] = events
+                return 0
+            return len(events)
+
+    def _write(self, events):
+        # バッファ中に消えた post / user が混ざると FK 違反でバッチごと失敗するので先に落とす
+        post_ids = set(Post.objects.filter(pk__in={e[0] for e in events}).values_list("pk", flat=True))
+        user_ids = {e[1] for e in events if e[1] is not None}
+        if user_ids:
+            user_ids = set(get_user_model().objects.filter(pk__in=user_ids).values_list("pk", flat=True))
+        events = [(p, u if u in user_ids else None, t) for p, u, t in events if p in post_ids]
+
+        per_post = defaultdict(int)
+        for post_id, _, _ in events:
+            per_post[post_id] += 1
+
+        # 加算量ごとにまとめて UPDATE（ほとんどの post は +1 なので数クエリで済む）
+        by_delta = defaultdict(list)
+        for post_id, n in per_post.items():
+            by_delta[n].append(post_id)
+
+        with transaction.atomic():
+            PostView.objects.bulk_create(
+                [PostView(post_id=p, user_id=u, viewed_at=t) for p, u, t in events]
+            )
+            for n, post_ids in by_delta.items():
+                Post.objects.filter(pk__in=post_ids).update(views_count=F("views_count") + n)
+
+    def _ensure_thread(self, conf):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            interval = conf["FLUSH_INTERVAL_MS"] / 1000
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="post-view-buffer", daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            self.flush()
+
+    def shutdown(self):
+        self._stop.set()
+        self.flush()
+
+
+view_buffer = PostViewBuffer()
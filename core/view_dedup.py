@@ -0,0 +1,56 @@
+"""投稿の閲覧の重複除け（同じ人の同じ投稿は1日1回だけ数える）。
+
+閲覧者ごと・日ごとに小さな Bloom filter（BITS ビット）をキャッシュに置く。
+セッションには何も書かないので、未ログインでも（IP + User-Agent で）効くし、
+閲覧のたびにセッションテーブルを書き換えることもない。
+
+Bloom filter なので、1日に何百件も見る人はまれに「見た」と誤判定されて
+1件数え漏れることがある（多く数えることはない）。
+"""
+import hashlib
+from datetime import datetime, time, timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+# 1024 バイト・ハッシュ 4 個: 1日 500 件見ても誤判定は 0.2% 程度
+BITS = 8192
+HASHES = 4
+
+
+def viewer_key(request):
+    """ログイン中はユーザー id、未ログインは IP + User-Agent のハッシュ。"""
+    if request.user.is_authenticated:
+        return f"u{request.user.id}"
+    raw = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return "a" + hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()
+
+
+def _positions(post_id):
+    digest = hashlib.blake2b(str(post_id).encode(), digest_size=4 * HASHES).digest()
+    return [int.from_bytes(digest[i * 4:(i + 1) * 4], "big") % BITS for i in range(HASHES)]
+
+
+def _seconds_until_tomorrow(now):
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), time.min, tzinfo=now.tzinfo)
+    # 日付が変わった直後に前日のキーが読まれないよう少し余裕を持たせて消す
+    return int((tomorrow - now).total_seconds()) + 60
+
+
+def first_view_today(request, post_id):
+    """今日この閲覧者がこの投稿を初めて見たなら True（そして見たことにする）。"""
+    now = timezone.localtime()
+    key = f"seen:{now.date():%Y%m%d}:{viewer_key(request)}"
+
+    bits = cache.get(key)
+    bits = bytearray(bits) if bits else bytearray(BITS // 8)
+
+    positions = _positions(post_id)
+    if all(bits[p // 8] & (1 << (p % 8)) for p in positions):
+        return False
+
+    for p in positions:
+        bits[p // 8] |= 1 << (p % 8)
+    # 同じ人が同時に別の投稿を開くと片方のビットが上書きで消え、その投稿がもう一度数えられることはある
+    cache.set(key, bytes(bits), _seconds_until_tomorrow(now))
+    return True
@@ -1,9 +1,22 @@
+import hashlib
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count
-from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbidden
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseBadRequest, HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
 from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import quote_etag
+from django.views.decorators.cache import cache_control
 from django.views.decorators.http import require_POST
+from django.views.decorators.vary import vary_on_cookie
 
 from .forms import CircleForm, PostCreateForm, ProfileForm
 from .models import (
@@ -14,157 +27,353 @@ from .models import (
     MessageRead,
     Notification,
     Post,
-    PostView,
     Profile,
-    Tag,
 )
+from . import detail_cache, facets, feed_cache, profiling, pwa, search, tags, view_dedup
+from .db_router import use_replicas
+from .notify import mark_all_read, notify, notify_many, unread_count
+from .pagination import InvalidCursor, keyset_page, ranked_page
+from .realtime import conversation_channel, get_broker
+from .rollups import trending_post_ids
+from .view_buffer import view_buffer
+
+# 既読レコードが無い会話は全部未読扱い
+NEVER_READ = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+# DB の id（bigint）に入る範囲
+MAX_ID = 2**63 - 1
+
+
+def _parse_id(value):
+    """クエリ文字列の id を int にする。1〜MAX_ID の整数でなければ None。"""
+    try:
+        n = int(value)
+    except (TypeError, ValueError):
+        return None
+    return n if 0 < n <= MAX_ID else None
+
 
 # -------------------------
 # App（単一画面）
 # -------------------------
-def app(request):
-    tab = request.GET.get("tab") or "home"
+# 初期表示のタブだけサーバー側で組み立て、残りのタブは setTab() から
+# tab_partial を叩いて遅延ロードする。
+PAGE_SIZE = 20
 
-    # HOME: posts
-    posts_qs = (
-        Post.objects.all()
-        .select_related("author")
-        .prefetch_related("tags")
-        .annotate(
-            favs_count=Count("favorites", distinct=True),
-            views_count=Count("views", distinct=True),
-        )
-    )
+# sort → keyset のキー（全部降順、最後は一意な id）
+SORT_KEYS = {
+    "recent": ("event_at", "created_at", "id"),
+    "popular": ("views_count", "created_at", "id"),
+    "fav": ("favs_count", "created_at", "id"),
+}
 
-    # 並び替え
+
+def _home_params(request):
     sort = request.GET.get("sort") or "recent"
-    if sort == "popular":
-        posts_qs = posts_qs.order_by("-views_count", "-created_at")
-    elif sort == "fav":
-        posts_qs = posts_qs.order_by("-favs_count", "-created_at")
-    else:
-        posts_qs = posts_qs.order_by("-event_at", "-created_at")
+    if sort not in SORT_KEYS and sort != "trending":
+        sort = "recent"
+    return {"sort": sort}
 
-    posts = list(posts_qs[:50])
 
-    # SEARCH
-    search_query = request.GET.get("q", "")
-    category = request.GET.get("category", "")
-    tag = request.GET.get("tag", "")
-    only_open = request.GET.get("open") == "1"
+def _home_posts(params, cursor=None):
+    posts_qs = Post.objects.all().select_related("author").prefetch_related("tags")
 
-    search_results = Post.objects.all().prefetch_related("tags").annotate(
-        favs_count=Count("favorites", distinct=True),
-        views_count=Count("views", distinct=True),
-    )
+    # 並び替え（favs_count / views_count はカラムなので index でそのまま引ける）
+    sort = params["sort"]
+    if sort == "trending":
+        # 直近7日の閲覧数（PostViewRollup だけを見る）
+        return ranked_page(posts_qs, trending_post_ids(days=7), cursor, PAGE_SIZE, tag=sort)
+    return keyset_page(posts_qs, SORT_KEYS[sort], cursor, PAGE_SIZE, tag=sort)
+
+
+def _search_params(request):
+    return {
+        "q": request.GET.get("q", ""),
+        "category": request.GET.get("category", ""),
+        "tag": request.GET.get("tag", ""),
+        "open": request.GET.get("open") == "1",
+    }
+
+
+def _search_matches(search_query):
+    """検索語だけで絞った投稿と関連度順の id（全文検索が使えなければ None）。"""
+    search_results = Post.objects.all()
 
-    if search_query:
+    ranked_ids = search.search_post_ids(search_query) if search_query else None
+    if ranked_ids is not None:
+        search_results = search_results.filter(pk__in=ranked_ids)
+    elif search_query:
+        # 全文検索が使えない DB 用
         search_results = search_results.filter(
-            title__icontains=search_query
-        ) | search_results.filter(circle_name__icontains=search_query) | search_results.filter(place__icontains=search_query)
+            Q(title__icontains=search_query)
+            | Q(circle_name__icontains=search_query)
+            | Q(place__icontains=search_query)
+            | Q(detail__icontains=search_query)
+            | Q(tags__name__icontains=search_query)
+        ).distinct()
+    return search_results, ranked_ids
 
-    if category:
-        search_results = search_results.filter(category=category)
 
-    if tag:
-        search_results = search_results.filter(tags__name=tag)
+def _search_posts(params, cursor=None):
+    search_results, ranked_ids = _search_matches(params["q"])
+    search_results = search_results.prefetch_related("tags")
 
-    if only_open:
-        # 終了は除外（event_at 過去 or closed）
-        now = timezone.now()
-        search_results = search_results.filter(event_at__gte=now).exclude(status="closed")
+    if params["category"]:
+        search_results = search_results.filter(category=params["category"])
 
-    search_results = search_results.order_by("-event_at", "-created_at")[:50]
+    if params["tag"]:
+        search_results = search_results.filter(tags__name=params["tag"])
 
-    # tags / choices
-    tags = Tag.objects.all().order_by("name")
-    category_choices = Post.CATEGORY_CHOICES
+    if params["open"]:
+        # 終了は除外。status は close_expired_posts が閉じるので、次の実行までの分は event_at で落とす
+        # （post_status_recent_idx / post_cat_status_recent_idx の範囲で引ける）
+        search_results = search_results.filter(status="open", event_at__gte=timezone.now())
 
-    # profile / circle
-    profile = None
-    circle = None
-    my_posts = []
-    saved_posts = []
-    unread_notifs = 0
-    conversations = []
+    if ranked_ids is not None:
+        # 関連度順（絞り込みで残った id だけ）
+        kept = set(search_results.values_list("pk", flat=True))
+        ranked_ids = [pk for pk in ranked_ids if pk in kept]
+        return ranked_page(search_results, ranked_ids, cursor, PAGE_SIZE, tag="rank")
+    return keyset_page(search_results, SORT_KEYS["recent"], cursor, PAGE_SIZE, tag="recent")
 
-    if request.user.is_authenticated:
-        profile, _ = Profile.objects.get_or_create(user=request.user)
-        circle, _ = Circle.objects.get_or_create(owner=request.user)
 
-        my_posts = (
-            Post.objects.filter(author=request.user)
-            .annotate(favs_count=Count("favorites", distinct=True), views_count=Count("views", distinct=True))
-            .order_by("-created_at")[:50]
-        )
+# feed 名 → (条件の取り出し, 1ページ分の取得, カード1枚のテンプレート)
+FEEDS = {
+    "home": (_home_params, _home_posts, "core/parts/post_card.html"),
+    "search": (_search_params, _search_posts, "core/parts/search_card.html"),
+}
 
-        saved_posts = (
-            Post.objects.filter(favorites=request.user)
-            .annotate(favs_count=Count("favorites", distinct=True), views_count=Count("views", distinct=True))
-            .order_by("-created_at")[:50]
-        )
 
-        unread_notifs = Notification.objects.filter(user=request.user, is_read=False).count()
+def _post_card_json(p):
+    return {
+        "id": p.id,
+        "title": p.title,
+        "circle_name": p.circle_name,
+        "place": p.place,
+        "event_at": p.event_at.strftime("%Y/%m/%d %H:%M"),
+        "status": p.effective_status,
+        "category": p.category,
+        "favs_count": p.favs_count,
+        "views_count": p.views_count,
+        "image_url": p.image.url if p.image else None,
+    }
+
+
+def _feed_payload(request, feed, cursor=None):
+    """フィード1ページ分（カードの HTML + JSON + 次のカーソル）。feed_cache 経由。"""
+    get_params, get_posts, template = FEEDS[feed]
+    params = get_params(request)
+
+    def build():
+        # フィードは少し古くても構わないので読み取りレプリカから
+        with use_replicas():
+            posts, next_cursor = get_posts(params, cursor)
+        return {
+            "items": [_post_card_json(p) for p in posts],
+            "html": "".join(render_to_string(template, {"p": p}) for p in posts),
+            "next_cursor": next_cursor,
+        }
+
+    return params, feed_cache.get_or_build(feed, {**params, "cursor": cursor}, build)
+
+
+def _home_context(request):
+    params, payload = _feed_payload(request, "home")
+    return {
+        "sort": params["sort"],
+        "feed_html": payload["html"],
+        "next_cursor": payload["next_cursor"],
+    }
+
+
+def _search_context(request):
+    params, payload = _feed_payload(request, "search")
+    counts = _search_facets(params["q"])
+    return {
+        "search_query": params["q"],
+        "category": params["category"],
+        "tag": params["tag"],
+        "only_open": params["open"],
+        "feed_html": payload["html"],
+        "next_cursor": payload["next_cursor"],
+        "tags": _search_tag_options(params["tag"], counts["tags"]),
+        "category_choices": [
+            (val, label, counts["category"].get(val, 0)) for val, label in Post.CATEGORY_CHOICES
+        ],
+        "open_count": counts["status"].get("open", 0),
+        "counts_capped": counts.get("capped", False),
+        "max_candidates": search.MAX_CANDIDATES,
+    }
 
-        # conversations list
-        conversations = []
-        convo_qs = (
-            Conversation.objects.filter(participants=request.user)
-            .prefetch_related("participants", "messages")
-            .order_by("-updated_at")[:50]
-        )
-        for c in convo_qs:
-            last = c.messages.order_by("-created_at").first()
-            last_text = last.body if last else ""
-            # unread count
-            read = MessageRead.objects.filter(conversation=c, user=request.user).first()
-            last_read_at = read.last_read_at if read else timezone.make_aware(timezone.datetime.min)
-            unread = c.messages.filter(created_at__gt=last_read_at).exclude(sender=request.user).count()
-
-            conversations.append({
-                "id": c.id,
-                "title": c.title or f"Conversation {c.id}",
-                "last_message": last_text,
-                "unread": unread,
-            })
-
-    ctx = {
-        "initial_tab": tab,
-        "posts": posts,
-        "sort": sort,
-
-        "search_query": search_query,
-        "category": category,
-        "tag": tag,
-        "only_open": only_open,
-        "search_results": search_results,
-
-        "tags": tags,
-        "category_choices": category_choices,
 
+def _search_facets(search_query):
+    """検索語ごとの件数（カテゴリ / タグ / 募集中）。フィードと同じく feed_cache に入れる。"""
+    def build():
+        with use_replicas():
+            matches, ranked_ids = _search_matches(search_query)
+            counts = facets.facet_counts(matches, with_tags=bool(search_query))
+        # 全文検索の候補は上位 MAX_CANDIDATES 件まで（結果も件数もそこまで）
+        counts["capped"] = ranked_ids is not None and len(ranked_ids) >= search.MAX_CANDIDATES
+        return counts
+
+    counts = feed_cache.get_or_build("facets", {"q": search_query}, build)
+    if not search_query:
+        # 全体のタグ件数は Tag.posts_count（投稿のたびに更新済み）
+        counts = {**counts, "tags": tags.top_tags(facets.TOP_TAGS)}
+    return counts
+
+
+def _search_tag_options(selected, tag_counts):
+    """タグの選択肢（名前, 件数）。検索語が無ければ全体の人気上位と同じ。選択中のものが圏外なら足す。"""
+    options = list(tag_counts)
+    if selected and selected not in {name for name, _ in options}:
+        options.append((selected, 0))
+    return options
+
+
+def _profile_context(request):
+    if not request.user.is_authenticated:
+        return {"profile": None, "circle": None, "my_posts": [], "saved_posts": []}
+
+    profile, _ = Profile.objects.get_or_create(user=request.user)
+    circle, _ = Circle.objects.get_or_create(owner=request.user)
+
+    my_posts = Post.objects.filter(author=request.user).order_by("-created_at")[:50]
+    saved_posts = Post.objects.filter(favorites=request.user).order_by("-created_at")[:50]
+
+    return {
         "profile": profile,
         "circle": circle,
         "my_posts": my_posts,
         "saved_posts": saved_posts,
-        "unread_notifs": unread_notifs,
-        "conversations": conversations,
     }
+
+
+def _messages_context(request):
+    if not request.user.is_authenticated:
+        return {"conversations": []}
+
+    # conversations list（最後のメッセージ・既読位置・未読数を1クエリで）
+    me = request.user
+    last_msg = Message.objects.filter(conversation=OuterRef("pk")).order_by("-created_at", "-id")
+    read_at = MessageRead.objects.filter(conversation=OuterRef("pk"), user=me).values("last_read_at")[:1]
+    unread = (
+        Message.objects.filter(
+            conversation=OuterRef("pk"),
+            created_at__gt=Coalesce(OuterRef("last_read_at"), Value(NEVER_READ)),
+        )
+        .exclude(sender=me)
+        .order_by()
+        .values("conversation")
+        .annotate(c=Count("*"))
+        .values("c")
+    )
+    convo_qs = (
+        Conversation.objects.filter(participants=me)
+        .annotate(
+            last_message=Subquery(last_msg.values("body")[:1]),
+            last_read_at=Subquery(read_at),
+        )
+        .annotate(unread=Coalesce(Subquery(unread), 0))
+        .order_by("-updated_at")[:50]
+    )
+    conversations = [
+        {
+            "id": c.id,
+            "title": c.title or f"Conversation {c.id}",
+            "last_message": c.last_message or "",
+            "unread": c.unread,
+        }
+        for c in convo_qs
+    ]
+
+    return {"conversations": conversations}
+
+
+# タブ名 → context builder（テンプレートは core/parts/tab_<タブ名>.html）
+TAB_CONTEXTS = {
+    "home": _home_context,
+    "search": _search_context,
+    "profile": _profile_context,
+    "messages": _messages_context,
+}
+
+
+def _render_app(request, tab, extra=None):
+    ctx = {"initial_tab": tab}
+
+    builder = TAB_CONTEXTS.get(tab)
+    if builder:
+        ctx.update(builder(request))
+
+    # ヘッダーのバッジは常に表示されるのでページ側で持つ
+    ctx["unread_notifs"] = 0
+    if request.user.is_authenticated:
+        ctx["unread_notifs"] = unread_count(request.user)
+
+    if extra:
+        ctx.update(extra)
     return render(request, "core/app.html", ctx)
 
 
+def app(request):
+    tab = request.GET.get("tab") or "home"
+    return _render_app(request, tab)
+
+
+@cache_control(private=True, max_age=30)
+@vary_on_cookie
+def tab_partial(request, tab):
+    builder = TAB_CONTEXTS.get(tab)
+    if builder is None:
+        raise Http404("unknown tab")
+    return render(request, f"core/parts/tab_{tab}.html", builder(request))
+
+
 # -------------------------
-# Post: detail JSON + view count
+# Feed: 無限スクロール用の続きページ（JSON）
 # -------------------------
-def post_detail_json(request, pk):
-    p = get_object_or_404(Post.objects.prefetch_related("tags").select_related("author"), pk=pk)
+@cache_control(private=True, max_age=30)
+@vary_on_cookie
+def feed_json(request, feed):
+    if feed not in FEEDS:
+        raise Http404("unknown feed")
+    try:
+        _, payload = _feed_payload(request, feed, request.GET.get("cursor") or None)
+    except InvalidCursor:
+        return HttpResponseBadRequest("bad cursor")
+    return JsonResponse({"ok": True, **payload})
+
+
+@staff_member_required
+def feed_cache_stats(request):
+    return JsonResponse({"ok": True, **feed_cache.stats()})
+
+
+@staff_member_required
+def profiling_report(request):
+    """ProfilingMiddleware が測ったリクエストの集計（view ごと）と直近の明細。?clear=1 で消す。"""
+    if request.GET.get("clear") == "1":
+        profiling.clear()
+    entries = profiling.recent()
+    return JsonResponse({
+        "ok": True,
+        "enabled": profiling.enabled(),
+        "summary": profiling.summarize(entries),
+        "recent": entries[::-1][:50],
+    })
 
-    # view count: 同一セッションで同一postは1回だけカウント
-    seen = request.session.get("seen_posts", [])
-    if pk not in seen:
-        PostView.objects.create(post=p, user=request.user if request.user.is_authenticated else None)
-        seen.append(pk)
-        request.session["seen_posts"] = seen
 
+# -------------------------
+# Post: detail JSON + view count
+# -------------------------
+def _post_detail_payload(pk):
+    """閲覧者に依存しない部分の詳細データ（キャッシュ。消すのは core/signals.py）。"""
+    cached = detail_cache.get(pk)
+    if cached is not None:
+        return cached
+
+    p = get_object_or_404(Post.objects.prefetch_related("tags"), pk=pk)
     data = {
         "id": p.id,
         "title": p.title,
@@ -172,14 +381,51 @@ def post_detail_json(request, pk):
         "place": p.place,
         "detail": p.detail,
         "event_at": p.event_at.strftime("%Y/%m/%d %H:%M"),
-        "status": p.effective_status,
         "category": p.category,
         "tags": [t.name for t in p.tags.all()],
         "image_url": p.image.url if p.image else None,
-        "is_owner": (request.user.is_authenticated and p.author_id == request.user.id),
-        "can_fav": request.user.is_authenticated,
     }
-    return JsonResponse(data)
+    cached = {
+        "data": data,
+        # ETag 用。タグの名前の変更では updated_at が変わらないので中身から作る
+        "digest": hashlib.md5(json.dumps(data, sort_keys=True).encode()).hexdigest()[:16],
+        # status は時間で変わるので毎回ここから出す
+        "status": p.status,
+        "event_at": p.event_at,
+        "author_id": p.author_id,
+    }
+    detail_cache.store(pk, cached)
+    return cached
+
+
+def post_detail_json(request, pk):
+    cached = _post_detail_payload(pk)
+
+    # view count: 同じ閲覧者の同じ post は1日1回だけ（セッションには書かない）
+    if view_dedup.first_view_today(request, pk):
+        # INSERT と views_count 加算はバッファ経由でまとめて書く
+        view_buffer.record(pk, request.user.id if request.user.is_authenticated else None)
+
+    # 自動終了：event_at 過ぎたら closed 扱い
+    status = "closed" if cached["event_at"] < timezone.now() else cached["status"]
+    is_owner = request.user.is_authenticated and cached["author_id"] == request.user.id
+    can_fav = request.user.is_authenticated
+
+    # Last-Modified は付けない（status やログイン状態の変化を表せず、If-Modified-Since だけだと古い 304 になる）
+    etag = quote_etag(f"{pk}-{cached['digest']}-{status}-{int(is_owner)}{int(can_fav)}")
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse({
+            **cached["data"],
+            "status": status,
+            "is_owner": is_owner,
+            "can_fav": can_fav,
+        })
+    response.headers["ETag"] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ["Cookie"])
+    return response
 
 
 # -------------------------
@@ -202,26 +448,22 @@ def post_create(request):
             p.save()
 
             # tags
-            tag_names = form.cleaned_data.get("tags", [])
-            tag_objs = []
-            for name in tag_names:
-                t, _ = Tag.objects.get_or_create(name=name)
-                tag_objs.append(t)
+            tag_objs = tags.resolve(form.cleaned_data.get("tags", []))
             if tag_objs:
                 p.tags.set(tag_objs)
 
             # notif
-            Notification.objects.create(
-                user=request.user,
-                notif_type="participation",  # 仮
-                text=f"投稿を作成しました: {p.title}",
+            notify(
+                [request.user.id],
+                "participation",  # 仮
+                f"投稿を作成しました: {p.title}",
                 url="/?tab=home",
             )
             return redirect("/?tab=home")
     else:
         form = PostCreateForm()
 
-    return render(request, "core/app.html", {"initial_tab": "create", "post_form": form})
+    return _render_app(request, "create", {"post_form": form})
 
 
 @login_required
@@ -235,19 +477,14 @@ def post_edit(request, pk):
         if form.is_valid():
             p = form.save()
             # tags reset
-            tag_names = form.cleaned_data.get("tags", [])
-            tag_objs = []
-            for name in tag_names:
-                t, _ = Tag.objects.get_or_create(name=name)
-                tag_objs.append(t)
-            p.tags.set(tag_objs)
+            p.tags.set(tags.resolve(form.cleaned_data.get("tags", [])))
             return redirect("/?tab=home")
     else:
         # 既存タグをカンマで入れる
         init = {"tags": ", ".join([t.name for t in p.tags.all()])}
         form = PostCreateForm(instance=p, initial=init)
 
-    return render(request, "core/app.html", {"initial_tab": "home", "edit_form": form, "edit_post_id": p.id})
+    return _render_app(request, "home", {"edit_form": form, "edit_post_id": p.id})
 
 
 @login_required
@@ -263,30 +500,100 @@ def post_delete(request, pk):
 # -------------------------
 # Favorite toggle
 # -------------------------
+# 1リクエストで受け付ける操作の上限
+MAX_FAVORITE_OPS = 100
+
+
+def _set_favorites(user, desired):
+    """desired（{post_id: 保存するか}）のとおりに Favorite をそろえる。何度送っても同じ結果になる。
+
+    値が None の post_id は今の状態を反転する（toggle_favorite 用）。
+    戻り値は ({post_id: (is_fav, favs_count)}, 存在しない post_id のリスト)。
+    """
+    with transaction.atomic():
+        # 同じ内容のバッチが同時に来ても（再送・二重 flush）favs_count を二重に増減しないよう、
+        # 投稿の行をロックしてから今の状態を読む（pk 順でロックしてデッドロックを避ける）
+        posts = {
+            pk: (author_id, title) for pk, author_id, title in
+            Post.objects.select_for_update().filter(pk__in=desired).order_by("pk")
+            .values_list("pk", "author_id", "title")
+        }
+        current = set(
+            Favorite.objects.filter(user=user, post_id__in=posts).values_list("post_id", flat=True)
+        )
+        wanted = {pk: (pk not in current) if desired[pk] is None else desired[pk] for pk in posts}
+        to_add = [pk for pk in posts if wanted[pk] and pk not in current]
+        to_remove = [pk for pk in posts if not wanted[pk] and pk in current]
+
+        if to_add:
+            Favorite.objects.bulk_create(
+                [Favorite(user=user, post_id=pk) for pk in to_add], ignore_conflicts=True
+            )
+            Post.objects.filter(pk__in=to_add).update(favs_count=F("favs_count") + 1)
+        if to_remove:
+            Favorite.objects.filter(user=user, post_id__in=to_remove).delete()
+            Post.objects.filter(pk__in=to_remove, favs_count__gt=0).update(favs_count=F("favs_count") - 1)
+
+    if to_add or to_remove:
+        feed_cache.invalidate_fav()
+
+    # notif to owner（何件あっても1ジョブ）
+    notify_many(
+        (author_id, "favorite", f"{user.username} が保存しました: {title}", "/?tab=home")
+        for author_id, title in (posts[pk] for pk in to_add)
+        if author_id != user.id
+    )
+
+    missing = [pk for pk in desired if pk not in posts]
+    counts = dict(Post.objects.filter(pk__in=posts).values_list("pk", "favs_count"))
+    state = {pk: (wanted[pk], counts.get(pk, 0)) for pk in posts}
+    return state, missing
+
+
 @login_required
 @require_POST
 def toggle_favorite(request, pk):
-    p = get_object_or_404(Post, pk=pk)
-    fav = Favorite.objects.filter(user=request.user, post=p).first()
-    if fav:
-        fav.delete()
-        is_fav = False
-    else:
-        Favorite.objects.create(user=request.user, post=p)
-        is_fav = True
-        # notif to owner
-        if p.author_id != request.user.id:
-            Notification.objects.create(
-                user=p.author,
-                notif_type="favorite",
-                text=f"{request.user.username} が保存しました: {p.title}",
-                url="/?tab=home",
-            )
-
-    favs_count = Favorite.objects.filter(post=p).count()
+    state, missing = _set_favorites(request.user, {pk: None})
+    if missing:
+        raise Http404("post not found")
+    is_fav, favs_count = state[pk]
     return JsonResponse({"ok": True, "is_fav": is_fav, "favs_count": favs_count})
 
 
+@login_required
+@require_POST
+def favorites_batch(request):
+    """保存状態をまとめて設定する。
+
+    body: {"ops": [{"post_id": 1, "desired_state": true}, ...]}
+    同じ post_id が複数あれば最後のものを使う。トグルではなく「こうしたい」を送るので、
+    二重送信しても結果は変わらない。
+    """
+    try:
+        ops = json.loads(request.body)["ops"]
+        desired = {op["post_id"]: op["desired_state"] for op in ops}
+    except (ValueError, KeyError, TypeError):
+        return HttpResponseBadRequest("bad ops")
+    # post_id は id の範囲の int（bool・float・文字列は不可）、desired_state は bool だけ
+    if not all(
+        type(pk) is int and 0 < pk <= MAX_ID and isinstance(state, bool)
+        for pk, state in desired.items()
+    ):
+        return HttpResponseBadRequest("bad ops")
+    if len(desired) > MAX_FAVORITE_OPS:
+        return HttpResponseBadRequest(f"too many ops (max {MAX_FAVORITE_OPS})")
+
+    state, missing = _set_favorites(request.user, desired)
+    return JsonResponse({
+        "ok": True,
+        "results": [
+            {"post_id": pk, "is_fav": is_fav, "favs_count": favs_count}
+            for pk, (is_fav, favs_count) in state.items()
+        ],
+        "missing": missing,
+    })
+
+
 # -------------------------
 # Profile / Circle save
 # -------------------------
@@ -302,16 +609,15 @@ def profile_save(request):
     if p_form.is_valid() and c_form.is_valid():
         p_form.save()
         c_form.save()
-        Notification.objects.create(
-            user=request.user,
-            notif_type="participation",
-            text="プロフィールを更新しました",
+        notify(
+            [request.user.id],
+            "participation",
+            "プロフィールを更新しました",
             url="/?tab=profile",
         )
         return redirect("/?tab=profile")
     # エラー時も app に返す
-    return render(request, "core/app.html", {
-        "initial_tab": "profile",
+    return _render_app(request, "profile", {
         "profile": profile,
         "circle": circle,
         "profile_form": p_form,
@@ -346,42 +652,115 @@ def start_conversation(request, post_id):
     convo.participants.add(me, other)
 
     Message.objects.create(conversation=convo, sender=me, body="はじめまして！投稿を見て連絡しました。")
-    Notification.objects.create(
-        user=other,
-        notif_type="message",
-        text=f"新しいメッセージ: {post.title}",
-        url="/?tab=messages",
+    notify(
+        [other.id],
+        "message",
+        f"新しいメッセージ: {post.title}",
+        url=f"/?tab=messages&open_convo={convo.id}",
+        conversation_id=convo.id,
     )
     return redirect(f"/?tab=messages&open_convo={convo.id}")
 
 
+MESSAGE_PAGE_SIZE = 50
+
+
 @login_required
 def conversation_json(request, convo_id):
+    """会話のメッセージ（古い順）。
+
+    パラメータなし: 最新 MESSAGE_PAGE_SIZE 件
+    ?since=<id>: その id より新しいものだけ（ポーリング用）
+    ?before=<id>: その id より古いもの（遡り用、最新側から MESSAGE_PAGE_SIZE 件）
+    """
     convo = get_object_or_404(Conversation, pk=convo_id, participants=request.user)
-    msgs = convo.messages.select_related("sender").order_by("created_at")[:200]
+    msgs = convo.messages.select_related("sender")
+
+    since = request.GET.get("since")
+    before = request.GET.get("before")
+
+    anchor = None
+    if since or before:
+        anchor_id = _parse_id(since or before)
+        if anchor_id is None:
+            return HttpResponseBadRequest("bad cursor")
+        anchor = convo.messages.filter(pk=anchor_id).values("created_at", "id").first()
+        if anchor is None:
+            return HttpResponseBadRequest("unknown message")
+
+    has_more = False
+    if since:
+        # (created_at, id) > anchor
+        msgs = list(
+            msgs.filter(
+                Q(created_at__gt=anchor["created_at"]) | Q(created_at=anchor["created_at"], id__gt=anchor["id"])
+            ).order_by("created_at", "id")[:MESSAGE_PAGE_SIZE]
+        )
+    else:
+        if before:
+            msgs = msgs.filter(
+                Q(created_at__lt=anchor["created_at"]) | Q(created_at=anchor["created_at"], id__lt=anchor["id"])
+            )
+        msgs = list(msgs.order_by("-created_at", "-id")[:MESSAGE_PAGE_SIZE + 1])
+        has_more = len(msgs) > MESSAGE_PAGE_SIZE
+        msgs = msgs[:MESSAGE_PAGE_SIZE][::-1]
 
-    # mark read
-    read, _ = MessageRead.objects.get_or_create(conversation=convo, user=request.user)
-    read.last_read_at = timezone.now()
-    read.save(update_fields=["last_read_at"])
+    # mark read（遡りのときや、新しく読んだものが無いときは書かない）
+    if not before and msgs:
+        _mark_read(convo, request.user, msgs[-1].created_at)
 
     return JsonResponse({
         "ok": True,
         "id": convo.id,
         "title": convo.title,
-        "messages": [
-            {
-                "id": m.id,
-                "sender": m.sender.username,
-                "is_me": m.sender_id == request.user.id,
-                "body": m.body,
-                "created_at": m.created_at.strftime("%m/%d %H:%M"),
-            }
-            for m in msgs
-        ]
+        "has_more": has_more,
+        "messages": [_message_json(m, request.user.id) for m in msgs],
     })
 
 
+def _mark_read(convo, user, read_at):
+    """既読位置を read_at（返したうちで一番新しいメッセージの時刻）まで進める。
+
+    now にすると、1ページに収まらず まだ返していない新着まで既読になってしまう。
+    """
+    read = MessageRead.objects.filter(conversation=convo, user=user).first()
+    if read is None:
+        MessageRead.objects.create(conversation=convo, user=user, last_read_at=read_at)
+    elif read.last_read_at < read_at:
+        read.last_read_at = read_at
+        read.save(update_fields=["last_read_at"])
+
+
+def _message_json(m, viewer_id):
+    return {
+        "id": m.id,
+        "sender": m.sender.username,
+        "is_me": m.sender_id == viewer_id,
+        "body": m.body,
+        "created_at": m.created_at.strftime("%m/%d %H:%M"),
+    }
+
+
+def _post_message(convo, sender, body):
+    m = Message.objects.create(conversation=convo, sender=sender, body=body)
+    convo.updated_at = timezone.now()
+    convo.save(update_fields=["updated_at"])
+
+    # notif to others（fan-out はバックグラウンドで、未読があればまとめる）
+    notify(
+        convo.participants.exclude(id=sender.id).values_list("id", flat=True),
+        "message",
+        f"新しいメッセージ: {convo.title}",
+        url=f"/?tab=messages&open_convo={convo.id}",
+        conversation_id=convo.id,
+    )
+
+    # 購読中のクライアントへ（is_me は受け取る側で決める）
+    event = {**_message_json(m, None), "sender_id": sender.id}
+    transaction.on_commit(lambda: get_broker().publish(conversation_channel(convo.id), event))
+    return m
+
+
 @login_required
 @require_POST
 def send_message(request, convo_id):
@@ -390,32 +769,115 @@ def send_message(request, convo_id):
     if not body:
         return HttpResponseBadRequest("empty")
 
-    Message.objects.create(conversation=convo, sender=request.user, body=body)
-    convo.updated_at = timezone.now()
-    convo.save(update_fields=["updated_at"])
+    _post_message(convo, request.user, body)
+    return redirect(f"/?tab=messages&open_convo={convo.id}")
 
-    # notif to others
-    others = convo.participants.exclude(id=request.user.id)
-    for u in others:
-        Notification.objects.create(
-            user=u,
-            notif_type="message",
-            text=f"新しいメッセージ: {convo.title}",
-            url="/?tab=messages",
-        )
 
-    return redirect(f"/?tab=messages&open_convo={convo.id}")
+@login_required
+@require_POST
+def send_message_json(request, convo_id):
+    convo = get_object_or_404(Conversation, pk=convo_id, participants=request.user)
+    body = (request.POST.get("body") or "").strip()
+    if not body:
+        return JsonResponse({"ok": False, "error": "empty"}, status=400)
+
+    m = _post_message(convo, request.user, body)
+    return JsonResponse({"ok": True, "message": _message_json(m, request.user.id)})
+
+
+@login_required
+@require_POST
+def conversation_read(request, convo_id):
+    """既読の通知（SSE で受け取って表示したメッセージ用）。message_id までを既読にする。"""
+    convo = get_object_or_404(Conversation, pk=convo_id, participants=request.user)
+    message_id = _parse_id(request.POST.get("message_id"))
+    if message_id is None:
+        return HttpResponseBadRequest("bad message_id")
+    read_at = convo.messages.filter(pk=message_id).values_list("created_at", flat=True).first()
+    if read_at is None:
+        return HttpResponseBadRequest("unknown message")
+    _mark_read(convo, request.user, read_at)
+    return JsonResponse({"ok": True})
+
+
+# SSE のハートビート間隔（秒）。プロキシのアイドル切断よけ
+STREAM_HEARTBEAT = 15
+
+
+def _sse(event, viewer_id):
+    data = {**event, "is_me": event.get("sender_id") == viewer_id}
+    data.pop("sender_id", None)
+    return f"id: {event['id']}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@login_required
+async def conversation_stream(request, convo_id):
+    """会話の新着メッセージを Server-Sent Events で流す（ASGI で動かすこと）。
+
+    Last-Event-ID（再接続時にブラウザが付ける）か ?since= より後のメッセージを
+    先に DB から流し、その後は broker から来た分だけを送る。
+    """
+    user = await request.auser()
+    if not await Conversation.objects.filter(pk=convo_id, participants=user).aexists():
+        raise Http404("conversation not found")
+
+    try:
+        since = int(request.headers.get("Last-Event-ID") or request.GET.get("since") or 0)
+    except ValueError:
+        return HttpResponseBadRequest("bad since")
+
+    async def events():
+        last_id = since
+        async with get_broker().subscribe(conversation_channel(convo_id)) as sub:
+            if since:
+                backlog = (
+                    Message.objects.filter(conversation_id=convo_id, id__gt=since)
+                    .select_related("sender")
+                    .order_by("id")[:200]
+                )
+                async for m in backlog:
+                    yield _sse({**_message_json(m, None), "sender_id": m.sender_id}, user.id)
+                    last_id = m.id
+            while True:
+                event = await sub.get(timeout=STREAM_HEARTBEAT)
+                if event is None:
+                    yield ": ping\n\n"
+                    continue
+                if event["id"] <= last_id:
+                    continue
+                last_id = event["id"]
+                yield _sse(event, user.id)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    return response
 
 
 # -------------------------
 # Notifications
 # -------------------------
+NOTIFICATION_PAGE_SIZE = 50
+
+
 @login_required
 def notifications_json(request):
-    notifs = Notification.objects.filter(user=request.user).order_by("-created_at")[:50]
+    """通知一覧（新しい順）。?cursor= に next_cursor を渡すと続きを返す。"""
+    try:
+        notifs, next_cursor = keyset_page(
+            Notification.objects.filter(user=request.user),
+            ("created_at", "id"),
+            request.GET.get("cursor") or None,
+            NOTIFICATION_PAGE_SIZE,
+            tag="notif",
+        )
+    except InvalidCursor:
+        return HttpResponseBadRequest("bad cursor")
+
     return JsonResponse({
         "ok": True,
-        "unread": Notification.objects.filter(user=request.user, is_read=False).count(),
+        "unread": unread_count(request.user),
+        "next_cursor": next_cursor,
         "items": [
             {
                 "id": n.id,
@@ -423,6 +885,7 @@ def notifications_json(request):
                 "text": n.text,
                 "url": n.url,
                 "is_read": n.is_read,
+                "count": n.count,
                 "created_at": n.created_at.strftime("%m/%d %H:%M"),
             }
             for n in notifs
@@ -433,5 +896,19 @@ def notifications_json(request):
 @login_required
 @require_POST
 def notifications_mark_read(request):
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    mark_all_read(request.user)
     return JsonResponse({"ok": True})
+
+
+# -------------------------
+# PWA: service worker / オフラインページ
+# -------------------------
+# SW はスコープをサイト全体にするためルート直下で配る。中身が変わったら
+# ブラウザがすぐ気付くよう HTTP キャッシュはさせない。
+@cache_control(no_cache=True)
+def service_worker(request):
+    return HttpResponse(pwa.service_worker_script(), content_type="application/javascript")
+
+
+def offline(request):
+    return render(request, "core/offline.html")